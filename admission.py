@@ -0,0 +1,71 @@
+"""Admission control for inference: a concurrency limit, a bounded wait queue and per-request deadlines."""
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+ADMISSION_METRIC = "emosic_admission_total"
+ADMISSION_HELP = "Inference admission decisions: admitted, queued (had to wait), shed and fallback."
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot get an inference slot before its deadline."""
+
+
+class AdmissionController:
+    """Lets at most max_concurrent requests run inference, with up to max_queue more waiting their turn.
+
+    A request arriving to a full queue is shed immediately; a waiting request is shed once its
+    deadline passes. Either way the caller gets AdmissionRejected and should answer some cheaper way.
+    """
+
+    def __init__(self, max_concurrent=4, max_queue=32, deadline_seconds=3.0):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.deadline_seconds = deadline_seconds
+        self._active = 0
+        self._waiting = 0
+        self._slots = threading.Condition()
+        self._counters = {
+            result: REGISTRY.counter(ADMISSION_METRIC, ADMISSION_HELP, result=result)
+            for result in ("admitted", "queued", "shed", "fallback")
+        }
+        REGISTRY.gauge("emosic_inference_in_flight", "Requests currently running inference.", fn=lambda: self._active)
+        REGISTRY.gauge("emosic_admission_waiting", "Requests waiting for an inference slot.", fn=lambda: self._waiting)
+
+    def record_fallback(self):
+        """Counts a request that was answered by the fallback instead of the model."""
+        self._counters["fallback"].inc()
+
+    @contextmanager
+    def admit(self, deadline_seconds=None):
+        """Holds an inference slot for the with-block, which receives the seconds left until the deadline.
+
+        Raises AdmissionRejected if no slot frees up in time.
+        """
+        deadline = time.monotonic() + (self.deadline_seconds if deadline_seconds is None else deadline_seconds)
+        with self._slots:
+            if self._active >= self.max_concurrent:
+                if self._waiting >= self.max_queue:
+                    self._counters["shed"].inc()
+                    raise AdmissionRejected("inference wait queue is full")
+                self._counters["queued"].inc()
+                self._waiting += 1
+                try:
+                    while self._active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._counters["shed"].inc()
+                            raise AdmissionRejected("deadline passed while waiting for an inference slot")
+                        self._slots.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            self._counters["admitted"].inc()
+        try:
+            yield max(0.0, deadline - time.monotonic())
+        finally:
+            with self._slots:
+                self._active -= 1
+                self._slots.notify()
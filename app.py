@@ -1,296 +1,370 @@
 import streamlit as st
 import os
-from transformers import pipeline
-import gspread # Ensure gspread is imported
+import time
+import contextlib
 from datetime import datetime # Ensure datetime is imported
+from inference_queue import InferenceQueue
+from prediction_cache import PredictionCache
+from feedback_writer import FeedbackWriter
+from long_text import LongTextClassifier
+from admission import AdmissionController, AdmissionRejected
+from lexicon_classifier import LexiconClassifier
+from startup import ModelLoader, read_emotion_labels
+from playlist_catalog import PlaylistCatalog
+from ranking import SongRanker
+from metrics import REGISTRY, RunTimer, error_counter, stage_timer, start_metrics_server
+# transformers and gspread are imported lazily (in startup.py and create_google_sheet_client) so the page renders fast.
 
 # --- Configuration ---
 MODEL_PATH = "./emosic_emotion_classifier_model"
+# Inference backend: "pytorch" runs the fp32 model, "onnx" runs the int8-quantized ONNX Runtime export
+# (build it with `python onnx_backend.py export` and verify it with `python onnx_backend.py check`),
+# "server" sends requests to a shared local inference server (`python inference_server.py`) over its Unix socket.
+INFERENCE_BACKEND = "pytorch"
+ONNX_MODEL_PATH = "./emosic_emotion_classifier_onnx"
+INFERENCE_SERVER_SOCKET = "/tmp/emosic-inference.sock"
+# EMOSIC_SYNTHETIC_MODEL=1 swaps in randomly initialized weights (same architecture and labels) for offline
+# benchmarks and load tests; predictions are meaningless, so never set it in production.
+USE_SYNTHETIC_MODEL = os.environ.get("EMOSIC_SYNTHETIC_MODEL") == "1"
+# A failed model load is cached process-wide like a successful one; the error page drops it and starts loading
+# again after this many seconds (or when Retry is clicked), so fixing the cause (e.g. starting the inference
+# server) doesn't need a restart.
+MODEL_LOAD_RETRY_SECONDS = 30
+# The model loads on a background thread and runs these once (singly and as one batch) before taking requests.
+MODEL_WARMUP_TEXTS = [
+    "I feel so energetic and happy today!",
+    "I'm worried about my exams and can't sleep.",
+    "Honestly I don't know how I feel right now, it has been a long week with ups and downs.",
+]
 GOOGLE_SHEET_NAME = "EmoSic_Feedback"
+# Songs live in a CSV data file (emotion, language, title, url); edits are picked up without a restart.
+PLAYLIST_CATALOG_PATH = "./playlists.csv"
+PLAYLIST_PAGE_SIZE = 10
+# Songs are ranked against the whole predicted emotion mix. Diversity favours songs with different emotion
+# profiles, jitter shuffles equally good songs, and recently shown songs are skipped on "More songs".
+RANKING_DIVERSITY = 0.1
+RANKING_JITTER = 0.01
+# Songs scoring below this fraction of the best match are left out, so a short list for the detected emotion
+# isn't filled up with songs for unrelated emotions; "More songs" only pages through the songs that remain.
+RANKING_MIN_SCORE_RATIO = 0.25
+RECENTLY_SHOWN_LIMIT = 200
+# Feedback is spooled locally and appended to the sheet in batches by a background writer.
+# Load tests and benchmarks point this and PREDICTION_CACHE_PATH at scratch files via the environment.
+FEEDBACK_SPOOL_PATH = os.environ.get("EMOSIC_FEEDBACK_SPOOL_PATH", "./emosic_feedback_spool.sqlite3")
+FEEDBACK_BATCH_SIZE = 50
+FEEDBACK_FLUSH_INTERVAL_SECONDS = 2
+# Requests from all sessions are batched together; a batch closes when full or after the max wait.
+INFERENCE_MAX_BATCH_SIZE = 16
+INFERENCE_MAX_WAIT_MS = 10
+# Admission control: at most this many requests per process run inference and this many more wait for a slot.
+# A request that can't get an answer within the deadline (or finds the queue full) is answered by a fast keyword
+# scorer instead and marked as approximate.
+INFERENCE_MAX_CONCURRENT = 8
+INFERENCE_MAX_WAITING = 32
+INFERENCE_DEADLINE_SECONDS = 3.0
+# Inputs longer than one window are split into overlapping token windows classified through the inference queue;
+# tokens past the budget are ignored so latency stays bounded. Aggregation is "mean", "max" or "weighted".
+LONG_TEXT_WINDOW_TOKENS = 256
+LONG_TEXT_STRIDE_TOKENS = 192
+LONG_TEXT_MAX_TOKENS = 1024
+LONG_TEXT_AGGREGATION = "weighted"
+# Predictions are cached per model fingerprint: a small in-memory LRU in front of a SQLite file shared by all processes.
+PREDICTION_CACHE_PATH = os.environ.get("EMOSIC_PREDICTION_CACHE_PATH", "./emosic_prediction_cache.sqlite3")
+PREDICTION_CACHE_MAX_ENTRIES = 4096
+PREDICTION_CACHE_TTL_SECONDS = 3600
+# Prometheus metrics are served on localhost at http://127.0.0.1:<port>/metrics. Metrics are per process, so when
+# several Streamlit processes share a host, start each with its own EMOSIC_METRICS_PORT and scrape them all.
+# The sidebar metrics panel is shown when the page is opened with ?admin=<token> matching the "emosic_admin_token"
+# secret.
+METRICS_PORT = int(os.environ.get("EMOSIC_METRICS_PORT", "9464"))
+# Secondary emotions at or above this probability are shown next to the detected one.
+MIXED_EMOTION_THRESHOLD = 0.20
+
+# Counts full-script reruns and their CPU time; reruns of only the playlist or feedback fragment are counted
+# under their own scopes (see fragment_run), so the two add up to every run the server did.
+script_run = RunTimer("script").start()
+
+
+def fragment_run(scope):
+    """Counts a fragment-only rerun under scope; a fragment drawn during a full run is already counted as "script".
+
+    A fragment rerun executes with the globals of the full run that defined it, whose script_run has stopped.
+    """
+    return contextlib.nullcontext() if script_run.running else RunTimer(scope)
 
 # --- 1. Load the Emotion Classification Model ---
 @st.cache_resource
-def load_emotion_model(model_directory):
-    """Loads the pre-trained emotion classification pipeline from the specified directory."""
-    try:
-        classifier = pipeline("sentiment-analysis", model=model_directory, tokenizer=model_directory)
-        return classifier
-    except Exception as e:
-        st.error(f"Error loading emotion model: {e}")
+def get_model_loader(model_directory, backend="pytorch"):
+    """Starts loading and warming up the emotion model in the background, so the page can render meanwhile."""
+    return ModelLoader(
+        model_directory,
+        backend,
+        warmup_texts=MODEL_WARMUP_TEXTS,
+        synthetic=USE_SYNTHETIC_MODEL,
+        server_socket=INFERENCE_SERVER_SOCKET,
+        # A hung server must not hold the queue's single worker past the request deadline.
+        server_timeout=INFERENCE_DEADLINE_SECONDS
+    )
+
+@st.cache_resource
+def get_inference_queue(model_directory, backend="pytorch"):
+    """Returns the process-wide micro-batching queue shared by every session."""
+    return InferenceQueue(
+        get_model_loader(model_directory, backend).classifier,
+        max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+        max_wait_ms=INFERENCE_MAX_WAIT_MS
+    )
+
+@st.cache_resource
+def get_long_text_classifier(model_directory, backend="pytorch"):
+    """Returns the sliding-window classifier used for inputs that overflow one model window."""
+    return LongTextClassifier(
+        get_model_loader(model_directory, backend).classifier,
+        window_tokens=LONG_TEXT_WINDOW_TOKENS,
+        stride_tokens=LONG_TEXT_STRIDE_TOKENS,
+        max_tokens=LONG_TEXT_MAX_TOKENS,
+        aggregation=LONG_TEXT_AGGREGATION,
+        # Windows share the micro-batching queue, so they count against the request deadline like short texts.
+        queue=get_inference_queue(model_directory, backend)
+    )
+
+@st.cache_resource
+def get_prediction_cache(model_directory, backend="pytorch"):
+    """Returns the process-wide prediction cache, keyed to the loaded model's fingerprint."""
+    return PredictionCache(
+        PREDICTION_CACHE_PATH,
+        get_model_loader(model_directory, backend).fingerprint,
+        max_entries=PREDICTION_CACHE_MAX_ENTRIES,
+        ttl_seconds=PREDICTION_CACHE_TTL_SECONDS
+    )
+
+@st.cache_resource
+def get_admission_controller():
+    """Returns the process-wide admission controller guarding the model."""
+    return AdmissionController(
+        max_concurrent=INFERENCE_MAX_CONCURRENT,
+        max_queue=INFERENCE_MAX_WAITING,
+        deadline_seconds=INFERENCE_DEADLINE_SECONDS
+    )
+
+@st.cache_resource
+def get_fallback_classifier(model_directory):
+    """Returns the keyword scorer used when the model can't answer in time, over the model's own labels."""
+    return LexiconClassifier(read_emotion_labels(model_directory))
+
+@st.cache_resource
+def get_metrics_server(port):
+    """Starts the process-wide /metrics endpoint once."""
+    return start_metrics_server(port)
+
+get_metrics_server(METRICS_PORT)
+active_model_path = ONNX_MODEL_PATH if INFERENCE_BACKEND == "onnx" else MODEL_PATH
+model_loader = get_model_loader(active_model_path, INFERENCE_BACKEND)
+
+
+def show_model_load_error():
+    """Explains a failed model load, lets a later run retry it, and stops the script."""
+    st.error(f"Error loading emotion model: {model_loader.error}")
+    if INFERENCE_BACKEND == "onnx":
+        st.info(f"Please run `python onnx_backend.py export` to build '{active_model_path}' "
+                "and ensure onnxruntime is installed.")
+    elif INFERENCE_BACKEND == "server":
+        st.info(f"Please start the inference server with `python inference_server.py --socket {INFERENCE_SERVER_SOCKET}`.")
+    else:
         st.info("Please ensure the 'emosic_emotion_classifier_model' folder is in the same directory as app.py "
                 "and contains all model files (pytorch_model.bin/model.safetensors, config.json, tokenizer.json, etc.).")
-        st.stop()
-
-emotion_classifier = load_emotion_model(MODEL_PATH)
-
-
-# --- 2. Define Song Playlists (UPDATED FOR ENGLISH YOUTUBE LINKS) ---
-EMOTION_PLAYLISTS = {
-    "joy": {
-        "English": [
-            {"title": "Happy - Pharrell Williams", "url": "https://www.youtube.com/results?search_query=Pharrell+Williams+Happy"},
-            {"title": "Ed Sheeran - Sapphire", "url": "https://youtu.be/JgDNFQ2RaLQ?si=qDSygwPlr5mb-NkZ"},
-            {"title": "Walking on Sunshine - Katrina and the Waves", "url": "https://www.youtube.com/results?search_query=Walking+on+Sunshine+Katrina+and+the+Waves"},
-            {"title": "Can't Stop the Feeling! - Justin Timberlake", "url": "https://www.youtube.com/results?search_query=Justin+Timberlake+Can%27t+Stop+the+Feeling"},
-            {"title": "Shake It Off - Taylor Swift", "url": "https://www.youtube.com/results?search_query=Taylor+Swift+Shake+It+Off"},
-            {"title": "Treasure - Bruno Mars", "url": "https://www.youtube.com/results?search_query=Bruno+Mars+Treasure"},
-            {"title": "Levitating - Dua Lipa", "url": "https://www.youtube.com/results?search_query=Dua+Lipa+Levitating"},
-            {"title": "Uptown Funk - Mark Ronson ft. Bruno Mars", "url": "https://www.youtube.com/results?search_query=Mark+Ronson+Bruno+Mars+Uptown+Funk"},
-            {"title": "I Gotta Feeling - Black Eyed Peas", "url": "https://www.youtube.com/results?search_query=Black+Eyed+Peas+I+Gotta+Feeling"},
-            {"title": "Good Life - OneRepublic", "url": "https://www.youtube.com/results?search_query=OneRepublic+Good+Life"},
-            {"title": "A Sky Full of Stars - Coldplay", "url": "https://www.youtube.com/results?search_query=Coldplay+A+Sky+Full+of+Stars"}
-        ],
-        "Hindi": [
-            {"title": "Dil Dhadakne Do", "url": "https://www.youtube.com/results?search_query=Dil+Dhadakne+Do+song"},
-            {"title": "Tareefan", "url": "https://www.youtube.com/results?search_query=Tareefan+song"},
-            {"title": "Gallan Goodiyaan", "url": "https://www.youtube.com/results?search_query=Gallan+Goodiyaan+song"},
-            {"title": "Jai Jai Shivshankar", "url": "https://www.youtube.com/results?search_query=Jai+Jai+Shivshankar+song"},
-            {"title": "Badtameez Dil", "url": "https://www.youtube.com/results?search_query=Badtameez+Dil+song"}
-        ],
-        "Telugu": [
-            {"title": "Butta Bomma", "url": "https://www.youtube.com/results?search_query=Butta+Bomma+song"},
-            {"title": "Ramuloo Ramulaa", "url": "https://www.youtube.com/results?search_query=Ramuloo+Ramulaa+song"},
-            {"title": "Samajavaragamana", "url": "https://www.youtube.com/results?search_query=Samajavaragamana+song"},
-            {"title": "Sarrainodu", "url": "https://www.youtube.com/results?search_query=Sarrainodu+song"},
-            {"title": "Nee Jathaga", "url": "https://www.youtube.com/results?search_query=Nee+Jathaga+song"}
-        ],
-        "Kannada": [
-            {"title": "Belageddu", "url": "https://www.youtube.com/results?search_query=Belageddu+song"},
-            {"title": "Neene Neene", "url": "https://www.youtube.com/results?search_query=Neene+Neene+song"},
-            {"title": "Salaam Rocky Bhai", "url": "https://www.youtube.com/results?search_query=Salaam+Rocky+Bhai+song"},
-            {"title": "Yajamana", "url": "https://www.youtube.com/results?search_query=Yajamana+song"},
-            {"title": "Geleya Nanna Geleya", "url": "https://www.youtube.com/results?search_query=Geleya+Nanna+Geleya+song"}
-        ]
-    },
-    "sadness": {
-        "English": [
-            {"title": "Someone Like You - Adele", "url": "https://www.youtube.com/results?search_query=Adele+Someone+Like+You"},
-            {"title": "Too Good at Goodbyes - Sam Smith", "url": "https://www.youtube.com/results?search_query=Sam+Smith+Too+Good+at+Goodbyes"},
-            {"title": "Everything I Wanted - Billie Eilish", "url": "https://www.youtube.com/results?search_query=Billie+Eilish+Everything+I+Wanted"},
-            {"title": "Someone You Loved - Lewis Capaldi", "url": "https://www.youtube.com/results?search_query=Lewis+Capaldi+Someone+You+Loved"},
-            {"title": "Goodbye My Lover - James Blunt", "url": "https://www.youtube.com/results?search_query=James+Blunt+Goodbye+My+Lover"},
-            {"title": "Let Her Go - Passenger", "url": "https://www.youtube.com/results?search_query=Passenger+Let+Her+Go"},
-            {"title": "Fix You - Coldplay", "url": "https://www.youtube.com/results?search_query=Coldplay+Fix+You"},
-            {"title": "Drivers License - Olivia Rodrigo", "url": "https://www.youtube.com/results?search_query=Olivia+Rodrigo+Drivers+License"},
-            {"title": "Photograph - Ed Sheeran", "url": "https://www.youtube.com/results?search_query=Ed+Sheeran+Photograph"},
-            {"title": "Breathe Me - Sia", "url": "https://www.youtube.com/results?search_query=Sia+Breathe+Me"}
-        ],
-        "Hindi": [
-            {"title": "Kabira", "url": "https://www.youtube.com/results?search_query=Kabira+song"},
-            {"title": "Channa Mereya", "url": "https://www.youtube.com/results?search_query=Channa+Mereya+song"},
-            {"title": "Tujhe Kitna Chahne Lage", "url": "https://www.youtube.com/results?search_query=Tujhe+Kitna+Chahne+Lage+song"},
-            {"title": "Agar Tum Saath Ho", "url": "https://www.youtube.com/results?search_query=Agar+Tum+Saath+Ho+song"},
-            {"title": "Main Yahaan Hoon", "url": "https://www.youtube.com/results?search_query=Main+Yahaan+Hoon+song"}
-        ],
-        "Telugu": [
-            {"title": "Nuvve Nuvve", "url": "https://www.youtube.com/results?search_query=Nuvve+Nuvve+song"},
-            {"title": "Yeduta Nilichindi", "url": "https://www.youtube.com/results?search_query=Yeduta+Nilichindi+song"},
-            {"title": "Nee Kallalona", "url": "https://www.youtube.com/results?search_query=Nee+Kallalona+song"},
-            {"title": "Oohalu Gusagusalade", "url": "https://www.youtube.com/results?search_query=Oohalu+Gusagusalade+song"},
-            {"title": "Mounamgaane", "url": "https://www.youtube.com/results?search_query=Mounamgaane+song"}
-        ],
-        "Kannada": [
-            {"title": "Ninnindale", "url": "https://www.youtube.com/results?search_query=Ninnindale+song"},
-            {"title": "Ee Sanje", "url": "https://www.youtube.com/results?search_query=Ee+Sanje+song"},
-            {"title": "Kanasalu Neene", "url": "https://www.youtube.com/results?search_query=Kanasalu+Neene+song"},
-            {"title": "Neeralli Sanna", "url": "https://www.youtube.com/results?search_query=Neeralli+Sanna+song"},
-            {"title": "Usire Usire", "url": "https://www.youtube.com/results?search_query=Usire+Usire+song"}
-        ]
-    },
-    "anger": {
-        "English": [
-            {"title": "Numb - Linkin Park", "url": "https://www.youtube.com/results?search_query=Linkin+Park+Numb"},
-            {"title": "Lose Yourself - Eminem", "url": "https://www.youtube.com/results?search_query=Eminem+Lose+Yourself"},
-            {"title": "Believer - Imagine Dragons", "url": "https://www.youtube.com/results?search_query=Imagine+Dragons+Believer"},
-            {"title": "Boulevard of Broken Dreams - Green Day", "url": "https://www.youtube.com/results?search_query=Green+Day+Boulevard+of+Broken+Dreams"},
-            {"title": "Smells Like Teen Spirit - Nirvana", "url": "https://www.youtube.com/results?search_query=Nirvana+Smells+Like+Teen+Spirit"},
-            {"title": "Disturbia - Rihanna", "url": "https://www.youtube.com/results?search_query=Rihanna+Disturbia"},
-            {"title": "You Should See Me in a Crown - Billie Eilish", "url": "https://www.youtube.com/results?search_query=Billie+Eilish+You+Should+See+Me+in+a+Crown"},
-            {"title": "Bring Me to Life - Evanescence", "url": "https://www.youtube.com/results?search_query=Evanescence+Bring+Me+to+Life"},
-            {"title": "Sorry Not Sorry - Demi Lovato", "url": "https://www.youtube.com/results?search_query=Demi+Lovato+Sorry+Not+Sorry"},
-            {"title": "I'm Not Okay (I Promise) - My Chemical Romance", "url": "https://www.youtube.com/results?search_query=My+Chemical+Romance+I%27m+Not+Okay"}
-        ],
-        "Hindi": [
-            {"title": "Ranjha Ranjha", "url": "https://www.youtube.com/results?search_query=Ranjha+Ranjha+song"},
-            {"title": "Bekhayali", "url": "https://www.youtube.com/results?search_query=Bekhayali+song"},
-            {"title": "Gali Gali", "url": "https://www.youtube.com/results?search_query=Gali+Gali+song"},
-            {"title": "Zinda", "url": "https://www.youtube.com/results?search_query=Zinda+song"},
-            {"title": "Kaala Chashma (from Baar Baar Dekho)", "url": "https://www.youtube.com/results?search_query=Kaala+Chashma+song"}
-        ],
-        "Telugu": [
-            {"title": "Bad Boy - Businessman", "url": "https://www.youtube.com/results?search_query=Bad+Boy+Businessman+song"},
-            {"title": "Top Lesi Poddi - Iddarammayilatho", "url": "https://www.youtube.com/results?search_query=Top+Lesi+Poddi+Iddarammayilatho+song"},
-            {"title": "Devudaa Devudaa - Gabbar Singh", "url": "https://www.youtube.com/results?search_query=Devudaa+Devudaa+Gabbar+Singh+song"},
-            {"title": "Blockbuster - Sarrainodu", "url": "https://www.youtube.com/results?search_query=Blockbuster+Sarrainodu+song"}
-        ],
-        "Kannada": [
-            {"title": "KGF Theme Song", "url": "https://www.youtube.com/results?search_query=KGF+Theme+Song"},
-            {"title": "Tagaru Banthu Tagaru", "url": "https://www.youtube.com/results?search_query=Tagaru+Banthu+Tagaru+song"},
-            {"title": "Chuttu Chuttu - Raambo 2", "url": "https://www.youtube.com/results?search_query=Chuttu+Chuttu+Raambo+2+song"},
-            {"title": "Dheera Dheera - K.G.F: Chapter 1", "url": "https://www.youtube.com/results?search_query=Dheera+Dheera+K.G.F+Chapter+1+song"}
-        ]
-    },
-    "fear": {
-        "English": [
-            {"title": "Creep - Radiohead", "url": "https://www.youtube.com/results?search_query=Radiohead+Creep"},
-            {"title": "Jealous - Labrinth", "url": "https://www.youtube.com/results?search_query=Labrinth+Jealous"},
-            {"title": "Elastic Heart - Sia", "url": "https://www.youtube.com/results?search_query=Sia+Elastic+Heart"},
-            {"title": "Take Me to Church - Hozier", "url": "https://www.youtube.com/results?search_query=Hozier+Take+Me+to+Church"},
-            {"title": "Demons - Imagine Dragons", "url": "https://www.youtube.com/results?search_query=Imagine+Dragons+Demons"},
-            {"title": "Runaway - Aurora", "url": "https://www.youtube.com/results?search_query=Aurora+Runaway"},
-            {"title": "Shake It Out - Florence + The Machine", "url": "https://www.youtube.com/results?search_query=Florence+The+Machine+Shake+It+Out"},
-            {"title": "When the Party’s Over - Billie Eilish", "url": "https://www.youtube.com/results?search_query=Billie+Eilish+When+the+Party%E2%80%99s+Over"},
-            {"title": "Liability - Lorde", "url": "https://www.youtube.com/results?search_query=Lorde+Liability"},
-            {"title": "Somewhere Only We Know - Keane", "url": "https://www.youtube.com/results?search_query=Keane+Somewhere+Only+We+Know"}
-        ],
-        "Hindi": [
-            {"title": "Aashayein", "url": "https://www.youtube.com/results?search_query=Aashayein+song"},
-            {"title": "Bandheya", "url": "https://www.youtube.com/results?search_query=Bandheya+song"},
-            {"title": "Zinda Hoon Yaar", "url": "https://www.youtube.com/results?search_query=Zinda+Hoon+Yaar+song"},
-            {"title": "Tu Hi Meri Shab Hai", "url": "https://www.youtube.com/results?search_query=Tu+Hi+Meri+Shab+Hai+song"},
-            {"title": "Darr (Title Song)", "url": "https://www.youtube.com/results?search_query=Darr+Title+Song"}
-        ],
-        "Telugu": [
-            {"title": "Gundello Emundo - Pelli Sandadi", "url": "https://www.youtube.com/results?search_query=Gundello+Emundo+Pelli+Sandadi+song"},
-            {"title": "Nijame Ne Chebutunna - Kothabangarulokam", "url": "https://www.youtube.com/results?search_query=Nijame+Ne+Chebutunna+Kothabangarulokam+song"},
-            {"title": "Oka Laila Kosam - Oka Laila Kosam", "url": "https://www.youtube.com/results?search_query=Oka+Laila+Kosam+song"},
-            {"title": "Manase Manase - Vasantham", "url": "https://www.youtube.com/results?search_query=Manase+Manase+Vasantham+song"}
-        ],
-        "Kannada": [
-            {"title": "Gooli - Gooli", "url": "https://www.youtube.com/results?search_query=Gooli+song"},
-            {"title": "Jotheyali - Ninnindale", "url": "https://www.youtube.com/results?search_query=Jotheyali+Ninnindale+song"},
-            {"title": "Nee Bandu Nintaaga - Gajakesari", "url": "https://www.youtube.com/results?search_query=Nee+Bandu+Nintaaga+Gajakesari+song"},
-            {"title": "Kariya I Love You - Kariya", "url": "https://www.youtube.com/results?search_query=Kariya+I+Love+You+song"}
-        ]
-    },
-    "love": {
-        "English": [
-            {"title": "Perfect - Ed Sheeran", "url": "https://www.youtube.com/results?search_query=Ed+Sheeran+Perfect"},
-            {"title": "All of Me - John Legend", "url": "https://www.youtube.com/results?search_query=John+Legend+All+of+Me"},
-            {"title": "Lover - Taylor Swift", "url": "https://www.youtube.com/results?search_query=Taylor+Swift+Lover"},
-            {"title": "Just the Way You Are - Bruno Mars", "url": "https://www.youtube.com/results?search_query=Bruno+Mars+Just+the+Way+You+Are"},
-            {"title": "Love Me Like You Do - Ellie Goulding", "url": "https://www.youtube.com/results?search_query=Ellie+Goulding+Love+Me+Like+You+Do"},
-            {"title": "Say You Won’t Let Go - James Arthur", "url": "https://www.youtube.com/results?search_query=James+Arthur+Say+You+Won%E2%80%99t+Let+Go"},
-            {"title": "Earned It - The Weeknd", "url": "https://www.youtube.com/results?search_query=The+Weeknd+Earned+It"},
-            {"title": "Young and Beautiful - Lana Del Rey", "url": "https://www.youtube.com/results?search_query=Lana+Del+Rey+Young+and+Beautiful"},
-            {"title": "A Thousand Years - Christina Perri", "url": "https://www.youtube.com/results?search_query=Christina+Perri+A+Thousand+Years"},
-            {"title": "Halo - Beyoncé", "url": "https://www.youtube.com/results?search_query=Beyonc%C3%A9+Halo"}
-        ],
-        "Hindi": [
-            {"title": "Tere Mere Sapne", "url": "https://www.youtube.com/results?search_query=Tere+Mere+Sapne+song"},
-            {"title": "Raabta", "url": "https://www.youtube.com/results?search_query=Raabta+song"},
-            {"title": "Tum Hi Ho", "url": "https://www.youtube.com/results?search_query=Tum+Hi+Ho+song"},
-            {"title": "Dil Diyan Gallan", "url": "https://www.youtube.com/results?search_query=Dil+Diyan+Gallan+song"},
-            {"title": "Pehla Nasha", "url": "https://www.youtube.com/results?search_query=Pehla+Nasha+song"}
-        ],
-        "Telugu": [
-            {"title": "Nee Choopule - Endukante Premanta", "url": "https://www.youtube.com/results?search_query=Nee+Choopule+Endukante+Premanta+song"},
-            {"title": "Yeto Vellipoyindhi Manasu - Yeto Vellipoyindhi Manasu", "url": "https://www.youtube.com/results?search_query=Yeto+Vellipoyindhi+Manasu+song"},
-            {"title": "Ninnu Kori - Ninnu Kori", "url": "https://www.youtube.com/results?search_query=Ninnu+Kori+song"},
-            {"title": "Priyatama Priyatama - Majili", "url": "https://www.youtube.com/results?search_query=Priyatama+Priyatama+Majili+song"}
-        ],
-        "Kannada": [
-            {"title": "Preethi Maayavi - Mungaru Male", "url": "https://www.youtube.com/results?search_query=Preethi+Maayavi+Mungaru+Male+song"},
-            {"title": "Neene Neene - Akash", "url": "https://www.youtube.com/results?search_query=Neene+Neene+Akash+song"},
-            {"title": "Usire Usire - Huccha", "url": "https://www.youtube.com/results?search_query=Usire+Usire+Huccha+song"},
-            {"title": "Nee Sanihake - Chakravyuha", "url": "https://www.youtube.com/results?search_query=Nee+Sanihake+Chakravyuha+song"}
-        ]
-    },
-    "surprise": {
-        "English": [
-            {"title": "Paradise - Coldplay", "url": "https://www.youtube.com/results?search_query=Coldplay+Paradise"},
-            {"title": "Fireflies - Owl City", "url": "https://www.youtube.com/results?search_query=Owl+City+Fireflies"},
-            {"title": "Counting Stars - OneRepublic", "url": "https://www.youtube.com/results?search_query=OneRepublic+Counting+Stars"},
-            {"title": "On Top of the World - Imagine Dragons", "url": "https://www.youtube.com/results?search_query=Imagine+Dragons+On+Top+of+the+World"},
-            {"title": "Ocean Eyes - Billie Eilish", "url": "https://www.youtube.com/results?search_query=Billie+Eilish+Ocean+Eyes"},
-            {"title": "Cosmic Love - Florence + The Machine", "url": "https://www.youtube.com/results?search_query=Florence+The+Machine+Cosmic+Love"},
-            {"title": "Midnight City - M83", "url": "https://www.youtube.com/results?search_query=M83+Midnight+City"},
-            {"title": "Castle on the Hill - Ed Sheeran", "url": "https://www.youtube.com/results?search_query=Ed+Sheeran+Castle+on+the+Hill"},
-            {"title": "Wish You Were Here - Pink Floyd", "url": "https://www.youtube.com/results?search_query=Pink+Floyd+Wish+You+Were+Here"},
-            {"title": "Youth - Troye Sivan", "url": "https://www.youtube.com/results?search_query=Troye+Sivan+Youth"}
-        ],
-        "Hindi": [
-            {"title": "Chaiyya Chaiyya", "url": "https://www.youtube.com/results?search_query=Chaiyya+Chaiyya+song"},
-            {"title": "Kala Chashma", "url": "https://www.youtube.com/results?search_query=Kala+Chashma+song"},
-            {"title": "London Thumakda", "url": "https://www.youtube.com/results?search_query=London+Thumakda+song"},
-            {"title": "Balam Pichkari", "url": "https://www.youtube.com/results?search_query=Balam+Pichkari+song"},
-            {"title": "Ghungroo", "url": "https://www.youtube.com/results?search_query=Ghungroo+song"}
-        ],
-        "Telugu": [
-            {"title": "Ringa Ringa - Arya 2", "url": "https://www.youtube.com/results?search_query=Ringa+Ringa+Arya+2+song"},
-            {"title": "Pakka Local - Janatha Garage", "url": "https://www.youtube.com/results?search_query=Pakka+Local+Janatha+Garage+song"},
-            {"title": "Ammadu Let's Do Kummudu - Khaidi No. 150", "url": "https://www.youtube.com/results?search_query=Ammadu+Let%27s+Do+Kummudu+Khaidi+No.+150+song"},
-            {"title": "Dimaak Kharaab - Ismart Shankar", "url": "https://www.youtube.com/results?search_query=Dimaak+Kharaab+Ismart+शंकर+song"}
-        ],
-        "Kannada": [
-            {"title": "Bombat - Raambo 2", "url": "https://www.youtube.com/results?search_query=Bombat+Raambo+2+song"},
-            {"title": "Karabuu - Pogaru", "url": "https://www.youtube.com/results?search_query=Karabuu+Pogaru+song"},
-            {"title": "Dostha Kano - Chakravyuha", "url": "https://www.youtube.com/results?search_query=Dostha+Kano+Chakravyuha+song"},
-            {"title": "Appu Dance - Appu", "url": "https://www.youtube.com/results?search_query=Appu+Dance+Appu+song"}
-        ]
-    }
-}
+    if st.button("🔄 Retry loading the model", key="retry_model_load_button"):
+        drop_failed_model_loader()
+        st.rerun()
+    retry_model_load_when_due()
+    st.stop()
+
+
+def drop_failed_model_loader():
+    """Clears the cached loader only while it is still the failed one this run drew.
+
+    Every session on the error page retries; without the check each would discard (and restart) whatever load
+    another session had just started, so several model copies could end up loading at once.
+    """
+    if get_model_loader(active_model_path, INFERENCE_BACKEND) is model_loader:
+        get_model_loader.clear()
+
+
+@st.fragment(run_every=5)
+def retry_model_load_when_due():
+    """Polls from the error page; reruns the page once another session has retried or the retry interval has passed."""
+    if get_model_loader(active_model_path, INFERENCE_BACKEND) is not model_loader:
+        st.rerun(scope="app")
+    if time.monotonic() - model_loader.finished_at >= MODEL_LOAD_RETRY_SECONDS:
+        drop_failed_model_loader()
+        st.rerun(scope="app")
+    st.caption(f"Retrying automatically every {MODEL_LOAD_RETRY_SECONDS} seconds.")
+
+
+@st.fragment(run_every=1)
+def show_model_warmup_status():
+    """Polls the background loader and reruns the whole page once the model is ready."""
+    if model_loader.is_done():
+        st.rerun(scope="app")
+    st.info("⏳ The emotion model is warming up... your playlist will be ready in a few seconds.")
+
+
+def classify_emotion(text):
+    """Returns (prediction, approximate) for text, skipping the model when the cache already has it.
+
+    approximate is True when the model was overloaded and the keyword scorer answered instead; prediction
+    is None if that scorer found no mood words either, since its scores would then be a uniform guess.
+    """
+    with stage_timer("classify"):
+        prediction_cache = get_prediction_cache(active_model_path, INFERENCE_BACKEND)
+        prediction = prediction_cache.get(text)
+        cache_result = "miss" if prediction is None else "hit"
+        REGISTRY.counter("emosic_prediction_cache_total", "Prediction cache lookups.", result=cache_result).inc()
+        if prediction is not None:
+            return prediction, False
+        admission = get_admission_controller()
+        try:
+            with admission.admit() as remaining:
+                long_text_classifier = get_long_text_classifier(active_model_path, INFERENCE_BACKEND)
+                # Tokenized once: the length check, the window split and the queue's batching all reuse the offsets.
+                offsets = long_text_classifier.token_offsets(text)
+                if long_text_classifier.is_long(text, offsets):
+                    prediction = long_text_classifier.classify(text, timeout=remaining, offsets=offsets)
+                else:
+                    prediction = get_inference_queue(active_model_path, INFERENCE_BACKEND).classify(
+                        text, timeout=remaining, length=len(offsets) + 2)
+        except (AdmissionRejected, TimeoutError, ConnectionError):
+            # ConnectionError: the inference server (INFERENCE_BACKEND = "server") is restarting or down.
+            # Approximate answers are never cached, so the next request for this text gets the model again.
+            admission.record_fallback()
+            with stage_timer("fallback_classify"):
+                fallback_classifier = get_fallback_classifier(MODEL_PATH)
+                if not fallback_classifier.hits(text):
+                    return None, True
+                return fallback_classifier(text, top_k=None), True
+        except Exception:
+            error_counter("classify").inc()
+            raise
+        prediction_cache.put(text, prediction)
+        return prediction, False
+
+
+def is_admin_session():
+    """True when the page was opened with ?admin=<token> matching the "emosic_admin_token" secret."""
+    try:
+        token = st.secrets.get("emosic_admin_token")
+    except FileNotFoundError:
+        return False
+    return bool(token) and st.query_params.get("admin") == token
+
+
+def show_metrics_panel():
+    """Renders current latency percentiles, counters and gauges in a sidebar expander."""
+    with st.sidebar.expander("📈 Metrics (admin)"):
+        latencies, values = [], []
+        for name, labels, kind, metric in REGISTRY.items():
+            label_text = ", ".join(f"{k}={v}" for k, v in labels)
+            if kind == "histogram":
+                latencies.append({
+                    "metric": label_text or name,
+                    "count": metric.count,
+                    "p50 ≤ ms": metric.percentile(0.50) * 1000,
+                    "p95 ≤ ms": metric.percentile(0.95) * 1000,
+                    "p99 ≤ ms": metric.percentile(0.99) * 1000,
+                })
+            else:
+                values.append({"metric": f"{name}{{{label_text}}}" if label_text else name, "value": metric.value})
+        st.caption("Latency (bucket upper bounds)")
+        st.dataframe(latencies, hide_index=True)
+        st.caption("Counters and gauges")
+        st.dataframe(values, hide_index=True)
+
+
+# --- 2. Song Playlists ---
+@st.cache_resource
+def get_playlist_catalog(path):
+    """Loads the song catalog once per process; it reloads itself when the data file changes."""
+    return PlaylistCatalog(path, labels=read_emotion_labels(MODEL_PATH))
+
+@st.cache_resource
+def get_song_ranker(path):
+    """Returns the ranker that scores the catalog against each predicted emotion distribution."""
+    return SongRanker(get_playlist_catalog(path), min_score_ratio=RANKING_MIN_SCORE_RATIO)
+
+playlist_catalog = get_playlist_catalog(PLAYLIST_CATALOG_PATH)
+song_ranker = get_song_ranker(PLAYLIST_CATALOG_PATH)
 
 # --- 3. Google Sheets Integration Functions ---
+def google_sheet_credentials():
+    """Collects the service-account credentials from Streamlit secrets, raising KeyError if one is missing."""
+    # Fetch each credential field individually from st.secrets.
+    # This is more robust against subtle TOML parsing issues with nested dictionaries.
+    # We use .get() with a default of None, then check for None for critical fields.
+    creds = {
+        "type": st.secrets.get("gcp_service_account_type"),
+        "project_id": st.secrets.get("gcp_service_account_project_id"),
+        "private_key_id": st.secrets.get("gcp_service_account_private_key_id"),
+        # The private_key is the most sensitive and often problematic field.
+        "private_key": st.secrets.get("gcp_service_account_private_key"),
+        "client_email": st.secrets.get("gcp_service_account_client_email"),
+        "client_id": st.secrets.get("gcp_service_account_client_id"),
+        "auth_uri": st.secrets.get("gcp_service_account_auth_uri"),
+        "token_uri": st.secrets.get("gcp_service_account_token_uri"),
+        "auth_provider_x509_cert_url": st.secrets.get("gcp_service_account_auth_provider_x509_cert_url"),
+        "client_x509_cert_url": st.secrets.get("gcp_service_account_client_x509_cert_url"),
+        "universe_domain": st.secrets.get("gcp_service_account_universe_domain")
+    }
+
+    # Basic validation: Check if critical fields are missing (will raise KeyError if None)
+    critical_fields = ["type", "project_id", "private_key", "client_email"]
+    for field in critical_fields:
+        if creds.get(field) is None:
+            raise KeyError(f"Critical Google Sheets credential '{field}' not found in Streamlit secrets.")
+    return creds
+
+
+def create_google_sheet_client():
+    """Authenticates with Google Sheets API using Streamlit secrets and returns a gspread client.
+
+    Called from the feedback writer's background thread, so it raises instead of rendering errors.
+    """
+    import gspread
+    return gspread.service_account_from_dict(google_sheet_credentials())
+
+
 @st.cache_resource
-def get_google_sheet_client():
-    """Authenticates with Google Sheets API using Streamlit secrets and returns a gspread client."""
-    try:
-        # Fetch each credential field individually from st.secrets.
-        # This is more robust against subtle TOML parsing issues with nested dictionaries.
-        # We use .get() with a default of None, then check for None for critical fields.
-        creds = {
-            "type": st.secrets.get("gcp_service_account_type"),
-            "project_id": st.secrets.get("gcp_service_account_project_id"),
-            "private_key_id": st.secrets.get("gcp_service_account_private_key_id"),
-            # The private_key is the most sensitive and often problematic field.
-            "private_key": st.secrets.get("gcp_service_account_private_key"),
-            "client_email": st.secrets.get("gcp_service_account_client_email"),
-            "client_id": st.secrets.get("gcp_service_account_client_id"),
-            "auth_uri": st.secrets.get("gcp_service_account_auth_uri"),
-            "token_uri": st.secrets.get("gcp_service_account_token_uri"),
-            "auth_provider_x509_cert_url": st.secrets.get("gcp_service_account_auth_provider_x509_cert_url"),
-            "client_x509_cert_url": st.secrets.get("gcp_service_account_client_x509_cert_url"),
-            "universe_domain": st.secrets.get("gcp_service_account_universe_domain")
-        }
-
-        # Basic validation: Check if critical fields are missing (will raise KeyError if None)
-        critical_fields = ["type", "project_id", "private_key", "client_email"]
-        for field in critical_fields:
-            if creds.get(field) is None:
-                raise KeyError(f"Critical Google Sheets credential '{field}' not found in Streamlit secrets.")
-
-        # Authenticate using the dictionary of credentials
-        gc = gspread.service_account_from_dict(creds)
-        return gc
-    except KeyError as ke: # Catch the specific KeyError if a secret is missing
-        st.error(f"Google Sheets API key not found in Streamlit secrets: {ke}. "
-                 "Please ensure ALL individual 'gcp_service_account_...' keys are configured in your app's secrets.")
-        st.stop() # Stop the app if secrets are not configured
-    except Exception as e:
-        st.error(f"Error authenticating with Google Sheets: {e}. "
-                 "Please check your Google Cloud setup and `st.secrets` configuration.")
-        st.stop()
+def get_feedback_writer():
+    """Returns the process-wide feedback writer; creating it replays rows spooled before a restart."""
+    return FeedbackWriter(
+        create_google_sheet_client,
+        GOOGLE_SHEET_NAME,
+        FEEDBACK_SPOOL_PATH,
+        batch_size=FEEDBACK_BATCH_SIZE,
+        flush_interval=FEEDBACK_FLUSH_INTERVAL_SECONDS
+    )
+
+feedback_writer = get_feedback_writer()
 
-   
-    
 
 def log_feedback_to_sheet(user_input, detected_emotion, language, accuracy_feedback, comment_feedback):
-    """Logs user feedback to the specified Google Sheet."""
+    """Queues user feedback for the Google Sheet; the background writer sends it in batches."""
+    try:
+        google_sheet_credentials()
+    except (KeyError, FileNotFoundError) as ke:
+        st.error(f"Google Sheets API key not found in Streamlit secrets: {ke}. "
+                 "Please ensure ALL individual 'gcp_service_account_...' keys are configured in your app's secrets.")
+        return
     try:
-        client = get_google_sheet_client()
-        spreadsheet = client.open(GOOGLE_SHEET_NAME)
-        worksheet = spreadsheet.sheet1
-
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         data_row = [timestamp, user_input, detected_emotion, language, accuracy_feedback, comment_feedback]
-        worksheet.append_row(data_row)
+        feedback_writer.submit(data_row)
         st.success("Feedback submitted successfully! Thank you for helping us improve.")
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error(f"Google Sheet '{GOOGLE_SHEET_NAME}' not found. Please ensure the sheet exists and its name matches.")
     except Exception as e:
-        st.error(f"Error logging feedback to Google Sheet: {e}. "
-                 "Ensure the service account has 'Editor' access to the sheet.")
+        st.error(f"Error saving feedback: {e}.")
+        return
+    if feedback_writer.last_error is not None:
+        st.warning(f"Your feedback is saved and will be sent to our sheet shortly "
+                   f"(the last upload attempt failed: {feedback_writer.last_error}).")
 
 
 # --- 4. Streamlit UI Design ---
@@ -322,6 +396,8 @@ st.sidebar.info("""
 """)
 st.sidebar.markdown("---")
 st.sidebar.caption("Made with ❤️ by Shrividya | EmoSic 🎵")
+if is_admin_session():
+    show_metrics_panel()
 
 
 # --- Main Content: Emotion Analysis ---
@@ -333,84 +409,180 @@ user_input_text = st.text_area(
     key="emotion_text_area"
 )
 
+if model_loader.is_done() and not model_loader.is_ready():
+    show_model_load_error()
+elif not model_loader.is_ready():
+    show_model_warmup_status()
+
 if 'detected_emotion' not in st.session_state:
     st.session_state.detected_emotion = None
+if 'emotion_distribution' not in st.session_state:
+    st.session_state.emotion_distribution = None
+if 'playlist_page' not in st.session_state:
+    st.session_state.playlist_page = 0
+if 'recently_shown' not in st.session_state:
+    st.session_state.recently_shown = {}
 if 'user_text_for_feedback' not in st.session_state:
     st.session_state.user_text_for_feedback = ""
+if 'classified_text' not in st.session_state:
+    st.session_state.classified_text = None
+if 'last_prediction' not in st.session_state:
+    st.session_state.last_prediction = None
+if 'emotion_approximate' not in st.session_state:
+    st.session_state.emotion_approximate = False
 
 
 # Predict emotion when button is clicked
-if st.button("🎵 Get My Playlist!", key="get_playlist_button"):
+if st.button("🎵 Get My Playlist!", key="get_playlist_button", disabled=not model_loader.is_ready()):
     if user_input_text.strip() == "":
         st.warning("🚫 Please write something to get your playlist!")
         st.session_state.detected_emotion = None
     else:
         with st.spinner("Analyzing emotion... Please wait."):
-            prediction = emotion_classifier(user_input_text)
-            emotion = prediction[0]['label'].lower()
-            confidence_score = prediction[0]['score'] * 100
-
-            st.session_state.detected_emotion = emotion
-            st.session_state.user_text_for_feedback = user_input_text
-
-            st.success(f"✅ Detected Emotion: **{emotion.title()}** (Confidence: {confidence_score:.2f}%)")
-            st.divider()
+            # Only run the model when the text changed since the last classification (or that one was approximate).
+            if (user_input_text != st.session_state.classified_text or st.session_state.last_prediction is None
+                    or st.session_state.emotion_approximate):
+                st.session_state.last_prediction, st.session_state.emotion_approximate = classify_emotion(user_input_text)
+                st.session_state.classified_text = user_input_text
+            prediction = st.session_state.last_prediction
+            if prediction is None:
+                # The quick guess had nothing to go on; last_prediction stays None so the next click retries.
+                st.session_state.detected_emotion = None
+                st.warning("⏳ EmoSic is very busy right now and couldn't tell the emotion from a quick read of your "
+                           "text. Please click the button again in a moment.")
+            else:
+                emotion = prediction[0]['label'].lower()
+                confidence_score = prediction[0]['score'] * 100
+
+                st.session_state.detected_emotion = emotion
+                st.session_state.emotion_distribution = {p['label'].lower(): p['score'] for p in prediction}
+                st.session_state.user_text_for_feedback = user_input_text
+
+                if st.session_state.emotion_approximate:
+                    st.warning(f"⚡ Approximate Emotion: **{emotion.title()}** — EmoSic is very busy right now, so this "
+                               "is a quick keyword-based guess. Click the button again in a moment for the full analysis.")
+                else:
+                    st.success(f"✅ Detected Emotion: **{emotion.title()}** (Confidence: {confidence_score:.2f}%)")
+                mixed = [p for p in prediction[1:] if p['score'] >= MIXED_EMOTION_THRESHOLD]
+                if mixed:
+                    st.caption("Also sensing: " + ", ".join(f"{p['label'].title()} ({p['score'] * 100:.0f}%)"
+                                                            for p in mixed))
+                st.divider()
 
 # --- 5. Display Song Recommendations ---
-if st.session_state.detected_emotion:
-    emotion_key = st.session_state.detected_emotion
-
-    st.subheader("🎙️ Pick your preferred language for music:")
-    languages_available = list(EMOTION_PLAYLISTS[emotion_key].keys())
-    try:
-        default_lang_index = languages_available.index(st.session_state.get("music_lang_select", "English"))
-    except ValueError:
-        default_lang_index = 0
-        
-    language_choice = st.selectbox(
-        "Choose your language:",
-        languages_available,
-        index=default_lang_index,
-        key="main_lang_choice"
-    )
-
-    if emotion_key in EMOTION_PLAYLISTS and language_choice in EMOTION_PLAYLISTS[emotion_key]:
-        songs = EMOTION_PLAYLISTS[emotion_key][language_choice]
+def next_playlist_page(language):
+    """Shows a fresh set of songs, keeping the ones on screen out of the next ranking."""
+    shown = st.session_state.recently_shown.setdefault(language, [])
+    shown.extend(song['id'] for song in st.session_state.playlist_songs)
+    del shown[:-RECENTLY_SHOWN_LIMIT]
+    st.session_state.playlist_page += 1
+
+
+def recommend_songs(distribution, language):
+    """Top PLAYLIST_PAGE_SIZE songs for the predicted emotion mix, skipping recently shown ones.
+
+    Also returns how many songs match the mix in all, which decides whether "More songs" is offered.
+    """
+    recent = st.session_state.recently_shown.get(language, [])
+    with stage_timer("ranking"):
+        # Scored once; both rank() calls and the total reuse it.
+        scores = song_ranker.score(distribution, language)
+        songs = song_ranker.rank(distribution, language, k=PLAYLIST_PAGE_SIZE, exclude=recent,
+                                 diversity=RANKING_DIVERSITY, jitter=RANKING_JITTER, scores=scores)
+        if len(songs) < PLAYLIST_PAGE_SIZE and recent:
+            # Every matching song has been shown: start over.
+            st.session_state.recently_shown[language] = []
+            songs = song_ranker.rank(distribution, language, k=PLAYLIST_PAGE_SIZE,
+                                     diversity=RANKING_DIVERSITY, jitter=RANKING_JITTER, scores=scores)
+    return songs, len(scores)
+
+
+def song_links_markdown(songs):
+    """One markdown block for the page's songs, so it renders as a single element."""
+    # Display each song title as a clickable YouTube link
+    return "\n\n".join(f"🎵 [{song['title']}]({song['url']})" for song in songs)
+
+
+@st.fragment
+def render_playlist_section():
+    """Language picker and songs; changing the language or paging reruns only this fragment."""
+    with fragment_run("playlist_fragment"):
+        emotion_key = st.session_state.detected_emotion
+
+        st.subheader("🎙️ Pick your preferred language for music:")
+        languages_available = playlist_catalog.languages(emotion_key)
+        try:
+            default_lang_index = languages_available.index(st.session_state.get("music_lang_select", "English"))
+        except ValueError:
+            default_lang_index = 0
+
+        language_choice = st.selectbox(
+            "Choose your language:",
+            languages_available,
+            index=default_lang_index,
+            key="main_lang_choice"
+        )
+
+        if not language_choice:
+            st.info("😢 Sorry! No songs found for this emotion yet. Stay tuned!")
+            return
+
+        # Rank once per prediction, language and page; other reruns reuse the stored list so it doesn't reshuffle.
+        ranking_key = (st.session_state.user_text_for_feedback, emotion_key, language_choice,
+                       st.session_state.playlist_page, playlist_catalog.version)
+        if st.session_state.get("playlist_key") != ranking_key:
+            # Fall back to the top label alone when no full distribution is available.
+            distribution = st.session_state.emotion_distribution or emotion_key
+            st.session_state.playlist_songs, st.session_state.playlist_total = recommend_songs(distribution,
+                                                                                              language_choice)
+            st.session_state.playlist_key = ranking_key
+        songs = st.session_state.playlist_songs
 
         if songs:
             st.subheader(f"🎶 Songs for you in {language_choice}:")
-            for song in songs:
-                # Display song title as a clickable YouTube link
-                # Assumes 'song' is a dictionary with 'title' and 'url' keys
-                st.markdown(f"🎵 [{song['title']}]({song['url']})")
+            with stage_timer("playlist_render"):
+                st.markdown(song_links_markdown(songs))
+            if st.session_state.playlist_total > PLAYLIST_PAGE_SIZE:
+                st.button("🔁 More songs", key="more_songs_button", on_click=next_playlist_page,
+                          args=(language_choice,))
         else:
             st.warning(f"😢 Sorry! No songs found for {emotion_key.title()} in {language_choice}.")
-    else:
-        st.info("😢 Sorry! No songs found for this emotion yet. Stay tuned!")
+
+
+if st.session_state.detected_emotion:
+    render_playlist_section()
 
 # --- 6. Feedback System ---
-st.divider()
-st.subheader("🙌 Give Us Your Feedback")
-st.markdown("Your thoughts help us grow! Let us know if the emotion detection was accurate and suggest new songs.")
-
-with st.form(key='feedback_form'):
-    feedback_emotion_accuracy = st.radio(
-        "✨ Was EmoSic helpful?",
-        ["😍 Loved it!", "🙂 It was okay", "😕 Needs work"],
-        key="emotion_accuracy_radio"
-    )
-    feedback_comments = st.text_area(
-        "💡 Suggestions to make EmoSic better:",
-        placeholder="Your thoughts help us grow!",
-        key="comments_text_area"
-    )
-    submit_feedback_button = st.form_submit_button("📬 Submit Feedback")
-
-    if submit_feedback_button:
-        log_feedback_to_sheet(
-            st.session_state.user_text_for_feedback,
-            st.session_state.detected_emotion.title() if st.session_state.detected_emotion else "N/A",
-            st.session_state.get("main_lang_choice", "N/A"),
-            feedback_emotion_accuracy,
-            feedback_comments
-        )
\ No newline at end of file
+@st.fragment
+def render_feedback_section():
+    """Feedback form; submitting it reruns only this fragment."""
+    with fragment_run("feedback_fragment"):
+        st.divider()
+        st.subheader("🙌 Give Us Your Feedback")
+        st.markdown("Your thoughts help us grow! Let us know if the emotion detection was accurate and suggest new songs.")
+
+        with st.form(key='feedback_form'):
+            feedback_emotion_accuracy = st.radio(
+                "✨ Was EmoSic helpful?",
+                ["😍 Loved it!", "🙂 It was okay", "😕 Needs work"],
+                key="emotion_accuracy_radio"
+            )
+            feedback_comments = st.text_area(
+                "💡 Suggestions to make EmoSic better:",
+                placeholder="Your thoughts help us grow!",
+                key="comments_text_area"
+            )
+            submit_feedback_button = st.form_submit_button("📬 Submit Feedback")
+
+            if submit_feedback_button:
+                log_feedback_to_sheet(
+                    st.session_state.user_text_for_feedback,
+                    st.session_state.detected_emotion.title() if st.session_state.detected_emotion else "N/A",
+                    st.session_state.get("main_lang_choice", "N/A"),
+                    feedback_emotion_accuracy,
+                    feedback_comments
+                )
+
+
+render_feedback_section()
+script_run.stop()
@@ -0,0 +1,211 @@
+"""Offline benchmarks for tokenization, the model forward pass, the classifier call and a page render.
+
+The model is built from config.json with random weights (see startup.load_emotion_model), so no
+LFS download or network access is needed. Before timing anything, the lean classifier's labels are
+checked against the transformers pipeline on the same weights. Results are written as JSON and can be
+compared against a saved baseline:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --output current.json --baseline baseline.json --threshold 0.10
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from lean_classifier import compare_predictions
+from onnx_backend import DEFAULT_PARITY_SAMPLES
+from startup import load_emotion_model
+
+MODEL_PATH = "./emosic_emotion_classifier_model"
+# Ordinary words that each encode to a single token, so a text of n words is roughly n tokens.
+FILLER_WORDS = ["today", "I", "feel", "very", "happy", "but", "also", "a", "little", "tired", "and", "sad"]
+
+
+def make_text(num_tokens):
+    return " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(num_tokens))
+
+
+def time_calls(fn, repeats, warmup=3):
+    """Runs fn warmup + repeats times and returns the timed durations in seconds."""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(durations, items_per_call=1):
+    """Latency percentiles in milliseconds plus throughput in items per second."""
+    ordered = sorted(durations)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    mean = statistics.fmean(ordered)
+    return {
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "mean_ms": mean * 1000,
+        "throughput_per_s": items_per_call / mean if mean else 0.0,
+        "samples": len(ordered),
+    }
+
+
+def bench_model(classifier, reference, lengths, batch_sizes, thread_counts, repeats):
+    """Sweeps input length, batch size and torch thread count over the model stages.
+
+    "pipeline" runs the same weights through the generic transformers pipeline (reference), as a
+    baseline for the lean "emotion_classifier" path.
+    """
+    import torch
+
+    tokenizer, model = classifier.tokenizer, classifier.model
+    results = []
+    for threads in thread_counts:
+        torch.set_num_threads(threads)
+        for length in lengths:
+            for batch_size in batch_sizes:
+                texts = [make_text(length)] * batch_size
+                encoded = tokenizer(texts, padding=True, truncation=True, return_tensors="pt")
+
+                def forward():
+                    with torch.inference_mode():
+                        model(**encoded)
+
+                stages = {
+                    "tokenization": lambda: tokenizer(texts, padding=True, truncation=True, return_tensors="pt"),
+                    "forward": forward,
+                    "emotion_classifier": lambda: classifier(texts, batch_size=batch_size, truncation=True),
+                    "pipeline": lambda: reference(texts, batch_size=batch_size, truncation=True),
+                }
+                for stage, fn in stages.items():
+                    results.append(dict(
+                        {"stage": stage, "tokens": length, "batch_size": batch_size, "threads": threads},
+                        **summarize(time_calls(fn, repeats), items_per_call=batch_size)
+                    ))
+    return results
+
+
+def bench_page_render(repeats, timeout=300):
+    """Times app.py reruns through Streamlit's AppTest: an idle rerender and a classify click."""
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["EMOSIC_SYNTHETIC_MODEL"] = "1"
+    # Keep benchmark feedback and predictions out of the production spool and cache.
+    scratch = tempfile.mkdtemp(prefix="emosic-benchmark-")
+    os.environ["EMOSIC_FEEDBACK_SPOOL_PATH"] = os.path.join(scratch, "feedback_spool.sqlite3")
+    os.environ["EMOSIC_PREDICTION_CACHE_PATH"] = os.path.join(scratch, "prediction_cache.sqlite3")
+    at = AppTest.from_file("app.py", default_timeout=timeout)
+    at.run()
+    deadline = time.monotonic() + timeout
+    # The model loads in the background; rerun until the playlist button is enabled.
+    while at.button(key="get_playlist_button").disabled:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Model did not become ready for the page-render benchmark")
+        time.sleep(0.5)
+        at.run()
+
+    counter = iter(range(10 ** 9))
+
+    def click():
+        # A fresh text per click keeps the prediction cache from short-circuiting the model.
+        at.text_area(key="emotion_text_area").input(f"I feel happy and a bit nervous {next(counter)}")
+        at.button(key="get_playlist_button").click().run()
+
+    results = []
+    for stage, fn in (("page_render_idle", at.run), ("page_render_classify", click)):
+        results.append(dict({"stage": stage, "tokens": None, "batch_size": 1, "threads": None},
+                            **summarize(time_calls(fn, repeats, warmup=1))))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns a description of every case whose p95 latency grew by more than threshold over baseline."""
+    def key(r):
+        return r["stage"], r["tokens"], r["batch_size"], r["threads"]
+
+    previous = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for r in results["results"]:
+        old = previous.get(key(r))
+        if old and old["p95_ms"] > 0 and r["p95_ms"] > old["p95_ms"] * (1 + threshold):
+            regressions.append(
+                f"{r['stage']} tokens={r['tokens']} batch={r['batch_size']} threads={r['threads']}: "
+                f"p95 {old['p95_ms']:.2f}ms -> {r['p95_ms']:.2f}ms"
+            )
+    return regressions
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline EmoSic latency benchmarks on a synthetic model.")
+    parser.add_argument("--model-dir", default=MODEL_PATH)
+    parser.add_argument("--lengths", type=_int_list, default=[16, 64, 256])
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32])
+    parser.add_argument("--threads", type=_int_list, default=[1, os.cpu_count() or 1])
+    parser.add_argument("--repeats", type=int, default=30)
+    parser.add_argument("--skip-render", action="store_true", help="Skip the AppTest page-render benchmark.")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative p95 growth.")
+    parser.add_argument("--min-agreement", type=float, default=1.0,
+                        help="Required top-1 label agreement with the transformers pipeline.")
+    args = parser.parse_args(argv)
+
+    import torch
+    import transformers
+
+    classifier = load_emotion_model(args.model_dir, synthetic=True)
+    reference = transformers.pipeline("sentiment-analysis", model=classifier.model, tokenizer=classifier.tokenizer)
+    agreement = compare_predictions(reference, classifier, DEFAULT_PARITY_SAMPLES)
+    print(f"Label agreement with the pipeline: {agreement['top1_agreement']:.0%} of {agreement['samples']} samples, "
+          f"max probability drift {agreement['max_probability_drift']:.2e}")
+    if agreement["top1_agreement"] < args.min_agreement:
+        print("LABEL MISMATCH: the lean classifier disagrees with the transformers pipeline")
+        sys.exit(1)
+    results = bench_model(classifier, reference, args.lengths, args.batch_sizes, sorted(set(args.threads)),
+                          args.repeats)
+    if not args.skip_render:
+        results.extend(bench_page_render(args.repeats))
+
+    report = {
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+        },
+        "label_agreement": agreement,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for r in results:
+        print(f"{r['stage']:>22} tokens={r['tokens']} batch={r['batch_size']} threads={r['threads']}: "
+              f"p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms p99={r['p99_ms']:.2f}ms "
+              f"{r['throughput_per_s']:.1f}/s")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
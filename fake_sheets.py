@@ -0,0 +1,51 @@
+"""In-process stand-in for the parts of a gspread client the app uses, for offline tests and load runs."""
+import threading
+import time
+
+
+class FakeWorksheet:
+    """Records appended rows in memory, optionally sleeping to imitate Sheets round-trip latency."""
+
+    def __init__(self, latency_ms=0, failures=None):
+        self.rows = []
+        self.calls = 0
+        self.latency = latency_ms / 1000.0
+        # Exceptions raised, in order, by the next calls; lets tests exercise quota backoff.
+        self.failures = list(failures or [])
+        self._lock = threading.Lock()
+
+    def _call(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self.failures:
+                raise self.failures.pop(0)
+
+    def append_row(self, row, **kwargs):
+        self._call()
+        with self._lock:
+            self.rows.append(list(row))
+
+    def append_rows(self, rows, **kwargs):
+        self._call()
+        with self._lock:
+            self.rows.extend(list(row) for row in rows)
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.sheet1 = worksheet
+
+
+class FakeGspreadClient:
+    """Mimics gspread.Client.open() for a single spreadsheet."""
+
+    def __init__(self, sheet_name, latency_ms=0, failures=None):
+        self.sheet_name = sheet_name
+        self.worksheet = FakeWorksheet(latency_ms, failures)
+
+    def open(self, title):
+        if title != self.sheet_name:
+            raise LookupError(f"Spreadsheet '{title}' not found")
+        return FakeSpreadsheet(self.worksheet)
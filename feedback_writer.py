@@ -0,0 +1,133 @@
+"""Background writer that spools feedback rows locally and flushes them to Google Sheets in batches."""
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from metrics import REGISTRY, error_counter, stage_histogram, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Status codes Sheets returns for per-minute quota exhaustion and transient backend trouble.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _status_code(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+class FeedbackWriter:
+    """Durable, non-blocking feedback sink.
+
+    submit() only appends the row to a SQLite spool and returns. A worker thread sends spooled rows
+    with worksheet.append_rows and deletes them once Sheets has accepted them, so rows left behind by
+    a crash are replayed on the next start (delivery is at-least-once).
+    """
+
+    def __init__(self, client_factory, sheet_name, spool_path, batch_size=50, flush_interval=2.0,
+                 initial_backoff=1.0, max_backoff=300.0):
+        self.client_factory = client_factory
+        self.sheet_name = sheet_name
+        self.spool_path = spool_path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.last_error = None
+        self.counters = {"submitted": 0, "flushed": 0, "batches": 0, "retries": 0}
+        self._worksheet = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL)")
+        self._sheet_append = stage_histogram("sheet_append")
+        self._errors = error_counter("sheet_write")
+        REGISTRY.gauge("emosic_feedback_spool_pending", "Feedback rows waiting to be sent to the sheet.",
+                       fn=self.pending)
+        self._worker = threading.Thread(target=self._run, name="emosic-feedback-writer", daemon=True)
+        self._worker.start()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.spool_path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL makes every committed submit survive a power loss, not just a process crash.
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, row):
+        """Durably spools one sheet row (a list of cell values) and wakes the worker."""
+        with stage_timer("feedback_spool"), self._connection() as conn:
+            conn.execute("INSERT INTO spool (row) VALUES (?)", (json.dumps(row),))
+        with self._lock:
+            self.counters["submitted"] += 1
+        self._wake.set()
+
+    def pending(self):
+        """Number of rows waiting to be written to the sheet."""
+        return self._connection().execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def close(self, timeout=5.0):
+        """Stops the worker after one last flush attempt; anything unsent stays in the spool."""
+        self._stop.set()
+        self._wake.set()
+        self._worker.join(timeout)
+
+    def _get_worksheet(self):
+        if self._worksheet is None:
+            self._worksheet = self.client_factory().open(self.sheet_name).sheet1
+        return self._worksheet
+
+    def _flush_batch(self):
+        """Sends up to batch_size spooled rows; returns how many were written."""
+        conn = self._connection()
+        spooled = conn.execute("SELECT id, row FROM spool ORDER BY id LIMIT ?", (self.batch_size,)).fetchall()
+        if not spooled:
+            return 0
+        started = time.perf_counter()
+        try:
+            self._get_worksheet().append_rows([json.loads(row) for _, row in spooled])
+        finally:
+            self._sheet_append.observe(time.perf_counter() - started)
+        with conn:
+            conn.execute("DELETE FROM spool WHERE id <= ?", (spooled[-1][0],))
+        with self._lock:
+            self.counters["flushed"] += len(spooled)
+            self.counters["batches"] += 1
+        return len(spooled)
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            if backoff:
+                # Back off without listening to new submits, which would otherwise retry straight away.
+                self._stop.wait(backoff)
+            else:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+            stopping = self._stop.is_set()
+            try:
+                while self._flush_batch() == self.batch_size:
+                    pass
+                backoff = 0.0
+                self.last_error = None
+            except Exception as e:
+                self._errors.inc()
+                self.last_error = e
+                with self._lock:
+                    self.counters["retries"] += 1
+                if _status_code(e) not in RETRYABLE_STATUS_CODES:
+                    # Not a quota error: the cached handle may be bad (expired auth, sheet renamed), so rebuild it.
+                    self._worksheet = None
+                backoff = min(self.max_backoff, max(self.initial_backoff, backoff * 2))
+                backoff *= random.uniform(0.8, 1.2)
+                logger.warning("Feedback flush failed, retrying in %.1fs: %s", backoff, e)
+            if stopping:
+                return
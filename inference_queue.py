@@ -0,0 +1,115 @@
+"""Shared micro-batching queue in front of the emotion classifier."""
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import REGISTRY, error_counter, stage_histogram
+
+
+class InferenceQueue:
+    """Collects classification requests from all sessions and runs them as dynamic batches."""
+
+    def __init__(self, classifier, max_batch_size=16, max_wait_ms=10, length_bucket=32):
+        self.classifier = classifier
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.length_bucket = max(1, int(length_bucket))
+        # submit() measures token lengths on the callers' threads unless they pass one in. A fast tokenizer can't be
+        # used from two threads at once ("Already borrowed"), so they share a private copy under a lock, leaving the
+        # original to the worker.
+        tokenizer = getattr(classifier, "tokenizer", None)
+        self._tokenizer = None if tokenizer is None else copy.deepcopy(tokenizer)
+        self._tokenizer_lock = threading.Lock()
+        self._requests = queue.Queue()
+        REGISTRY.gauge("emosic_inference_queue_depth", "Requests waiting for the inference worker.", fn=self.depth)
+        self._tokenize = stage_histogram("tokenize")
+        self._queue_wait = stage_histogram("queue_wait")
+        self._model_batch = stage_histogram("model_batch")
+        self._errors = error_counter("inference")
+        self._worker = threading.Thread(target=self._run, name="emosic-inference-queue", daemon=True)
+        self._worker.start()
+
+    def submit(self, text, length=None):
+        """Queues one text and returns a Future resolving to every label with its score, highest first.
+
+        length is the text's token count including special tokens, if the caller already tokenized it; it is only
+        used to group similar lengths into a batch, so an estimate is fine.
+        """
+        future = Future()
+        self._requests.put((self._token_length(text) if length is None else length, time.perf_counter(), text, future))
+        return future
+
+    def classify(self, text, timeout=None, length=None):
+        """Blocking wrapper around submit(); returns e.g. [{'label': 'joy', 'score': 0.98}, {'label': 'love', ...}, ...].
+
+        On timeout the request is withdrawn (if the worker has not started it yet) and TimeoutError is raised.
+        """
+        future = self.submit(text, length)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def depth(self):
+        """Number of requests waiting for the worker."""
+        return self._requests.qsize()
+
+    def _token_length(self, text):
+        if self._tokenizer is None:
+            return len(text.split())
+        with self._tokenizer_lock:
+            started = time.perf_counter()
+            length = len(self._tokenizer(text, add_special_tokens=True, truncation=True)["input_ids"])
+            self._tokenize.observe(time.perf_counter() - started)
+        return length
+
+    def _collect(self):
+        # Block for the first request, then keep filling the batch until it is full or max_wait has passed.
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Group requests of similar token length so each forward pass pads as little as possible.
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[0] // self.length_bucket, []).append(item)
+            for key in sorted(groups):
+                self._run_group(groups[key])
+
+    def _run_group(self, group):
+        started = time.perf_counter()
+        live = []
+        for _, enqueued, text, future in group:
+            if future.set_running_or_notify_cancel():
+                self._queue_wait.observe(started - enqueued)
+                live.append((text, future))
+        if not live:
+            return
+        texts = [text for text, _ in live]
+        futures = [future for _, future in live]
+        try:
+            outputs = self.classifier(texts, batch_size=len(texts), truncation=True, top_k=None)
+        except Exception as e:
+            self._errors.inc()
+            for future in futures:
+                future.set_exception(e)
+            return
+        finally:
+            self._model_batch.observe(time.perf_counter() - started)
+        for future, output in zip(futures, outputs):
+            # With top_k=None each text gets the whole distribution, so callers can show mixed emotions.
+            future.set_result(output)
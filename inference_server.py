@@ -0,0 +1,213 @@
+"""Local inference server: N pre-forked worker processes share one copy of the model weights.
+
+Run one server per host and point every Streamlit process at it (INFERENCE_BACKEND = "server" in app.py):
+
+    python inference_server.py --socket /tmp/emosic-inference.sock --workers 4 --threads-per-worker 1
+
+Each Streamlit process keeps its own metrics, so give every one its own endpoint and scrape them all:
+
+    EMOSIC_METRICS_PORT=9464 streamlit run app.py --server.port 8501
+    EMOSIC_METRICS_PORT=9465 streamlit run app.py --server.port 8502
+
+The PyTorch model is loaded once in the parent and the workers are forked afterwards, so the weight
+pages stay shared copy-on-write; each worker pins its own intra-op thread count so the workers
+together don't oversubscribe the cores. ONNX Runtime sessions can't survive a fork, so with
+--backend onnx each worker loads the (small, quantized) model itself.
+"""
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+
+from startup import classifier_fingerprint, load_emotion_model
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+# A worker that exits within WORKER_MIN_UPTIME_SECONDS of starting counts as a failed start. Restarts
+# after failed starts back off exponentially, and after MAX_FAILED_STARTS in a row (e.g. a missing or
+# broken ONNX export that kills every worker on load) the server gives up and exits with status 1.
+WORKER_MIN_UPTIME_SECONDS = 10.0
+RESTART_BACKOFF_SECONDS = 1.0
+MAX_RESTART_BACKOFF_SECONDS = 60.0
+MAX_FAILED_STARTS = 5
+
+
+def send_message(sock, payload):
+    body = json.dumps(payload).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Inference server connection closed mid-message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock):
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return json.loads(_recv_exactly(sock, size))
+
+
+def _handle(conn, classifier, fingerprint):
+    request = recv_message(conn)
+    try:
+        if request.get("op") == "fingerprint":
+            send_message(conn, {"fingerprint": fingerprint})
+            return
+        outputs = classifier(request["inputs"], **request.get("kwargs", {}))
+        send_message(conn, {"outputs": outputs})
+    except Exception as e:
+        send_message(conn, {"error": f"{type(e).__name__}: {e}"})
+
+
+def _worker_main(listener, classifier, fingerprint, model_directory, backend, threads):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if classifier is None:
+        classifier = load_emotion_model(model_directory, backend, intra_op_threads=threads)
+    else:
+        import torch
+        torch.set_num_threads(threads)
+    while True:
+        conn, _ = listener.accept()
+        with conn:
+            try:
+                _handle(conn, classifier, fingerprint)
+            except (ConnectionError, OSError) as e:
+                logger.warning("Dropped inference request: %s", e)
+
+
+def serve(model_directory, socket_path, workers, threads_per_worker=1, backend="pytorch", synthetic=False):
+    """Loads the model, forks the workers and restarts any that die; runs until SIGTERM/SIGINT.
+
+    Returns the exit status: 0 when stopped by a signal, 1 when workers kept dying on startup.
+    """
+    fingerprint = classifier_fingerprint(model_directory, synthetic)
+    classifier = None
+    if backend != "onnx":
+        # Load before forking and run nothing on it here, so no inference thread pools exist at fork time.
+        classifier = load_emotion_model(model_directory, backend, synthetic=synthetic)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+
+    # Move everything allocated so far out of the GC's reach, so collections in the workers don't
+    # touch (and un-share) the pages holding the model's Python objects.
+    gc.freeze()
+    context = multiprocessing.get_context("fork")
+    args = (listener, classifier, fingerprint, model_directory, backend, threads_per_worker)
+    processes = []
+    started_at = {}
+    failed_starts = 0
+
+    def start_worker():
+        process = context.Process(target=_worker_main, args=args, daemon=True)
+        process.start()
+        started_at[process.pid] = time.monotonic()
+        return process
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        processes = [start_worker() for _ in range(workers)]
+        logger.info("Serving %s on %s with %d workers", model_directory, socket_path, workers)
+        while True:
+            multiprocessing.connection.wait([p.sentinel for p in processes])
+            for i, process in enumerate(processes):
+                if process.is_alive():
+                    continue
+                uptime = time.monotonic() - started_at.pop(process.pid)
+                failed_starts = failed_starts + 1 if uptime < WORKER_MIN_UPTIME_SECONDS else 0
+                if failed_starts >= MAX_FAILED_STARTS:
+                    logger.error("Inference workers died on startup %d times in a row (last exit code %s); giving up",
+                                 failed_starts, process.exitcode)
+                    return 1
+                delay = 0.0
+                if failed_starts:
+                    delay = min(MAX_RESTART_BACKOFF_SECONDS, RESTART_BACKOFF_SECONDS * 2 ** (failed_starts - 1))
+                logger.warning("Inference worker %s exited with %s after %.1fs; restarting in %.1fs",
+                               process.pid, process.exitcode, uptime, delay)
+                time.sleep(delay)
+                processes[i] = start_worker()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        listener.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+    return 0
+
+
+class InferenceServerUnavailable(ConnectionError):
+    """The inference server could not be reached, timed out, or dropped the connection mid-request."""
+
+
+class InferenceClient:
+    """Pipeline-compatible proxy that sends each call to the inference server over its Unix socket.
+
+    The tokenizer is loaded locally (it is small) for callers that need token lengths or offsets.
+    """
+
+    def __init__(self, socket_path, model_directory, timeout=30.0):
+        from transformers import AutoTokenizer
+
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.tokenizer = AutoTokenizer.from_pretrained(model_directory)
+        self.fingerprint = self._request({"op": "fingerprint"})["fingerprint"]
+
+    def _request(self, payload):
+        # One connection per request: connecting to a Unix socket costs microseconds, and it lets
+        # the kernel hand each request to whichever worker is idle.
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                send_message(sock, payload)
+                response = recv_message(sock)
+        except OSError as e:
+            # Covers a missing socket, a refused or reset connection (server restarting) and a timeout.
+            raise InferenceServerUnavailable(f"Inference server at {self.socket_path} is unavailable: {e}") from e
+        if "error" in response:
+            raise RuntimeError(f"Inference server error: {response['error']}")
+        return response
+
+    def __call__(self, inputs, **kwargs):
+        return self._request({"inputs": inputs, "kwargs": kwargs})["outputs"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the EmoSic emotion classifier to local Streamlit processes.")
+    parser.add_argument("--model-dir", default="./emosic_emotion_classifier_model")
+    parser.add_argument("--backend", choices=["pytorch", "onnx"], default="pytorch")
+    parser.add_argument("--socket", default="/tmp/emosic-inference.sock")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--synthetic", action="store_true", help="Use randomly initialized weights (benchmarks only).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(serve(args.model_dir, args.socket, args.workers, args.threads_per_worker, args.backend, args.synthetic))
+
+
+if __name__ == "__main__":
+    main()
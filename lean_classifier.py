@@ -0,0 +1,124 @@
+"""Lean emotion classifier: the fast tokenizer and the model called directly, without the pipeline wrapper."""
+import abc
+import threading
+
+import numpy as np
+
+
+class ProbabilityClassifier(abc.ABC):
+    """Pipeline-compatible __call__ for classifiers that implement predict_proba() and set labels."""
+
+    labels = ()
+
+    @abc.abstractmethod
+    def predict_proba(self, texts, truncation=True):
+        """Returns a (len(texts), len(labels)) float32 array of probabilities."""
+
+    def top_k(self, probs, k=1):
+        """Indices of the k most likely labels in each row of probs, highest first."""
+        k = min(k, probs.shape[1])
+        top = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(probs, top, axis=1).argsort(axis=1)[:, ::-1]
+        return np.take_along_axis(top, order, axis=1)
+
+    def __call__(self, inputs, batch_size=None, truncation=True, **kwargs):
+        # Mirror the pipeline's output shapes: without top_k, one dict per text (a one-item list for a
+        # single string); with top_k (None meaning all labels), a sorted list of dicts per text.
+        legacy = "top_k" not in kwargs
+        top_k = 1 if legacy else (kwargs["top_k"] or len(self.labels))
+        single = isinstance(inputs, str)
+        texts = [inputs] if single else list(inputs)
+        batch_size = batch_size or len(texts) or 1
+
+        results = []
+        for start in range(0, len(texts), batch_size):
+            probs = self.predict_proba(texts[start:start + batch_size], truncation=truncation)
+            for row, indices in zip(probs, self.top_k(probs, top_k)):
+                ranked = [{"label": self.labels[i], "score": float(row[i])} for i in indices]
+                results.append(ranked[0] if legacy else ranked)
+        if single:
+            return results if legacy else results[0]
+        return results
+
+
+def compare_predictions(reference, candidate, samples):
+    """Top-1 label agreement and the largest per-label probability difference between two classifiers.
+
+    Both take pipeline-style calls; reference is typically the transformers pipeline.
+    """
+    samples = list(samples)
+    agree = 0
+    max_drift = 0.0
+    for expected, actual in zip(reference(samples, top_k=None, truncation=True),
+                                candidate(samples, top_k=None, truncation=True)):
+        if expected[0]["label"] == actual[0]["label"]:
+            agree += 1
+        expected_scores = {p["label"]: p["score"] for p in expected}
+        for p in actual:
+            max_drift = max(max_drift, abs(p["score"] - expected_scores[p["label"]]))
+    return {
+        "samples": len(samples),
+        "top1_agreement": agree / len(samples) if samples else 1.0,
+        "max_probability_drift": max_drift,
+    }
+
+
+class LeanEmotionClassifier(ProbabilityClassifier):
+    """Runs RobertaForSequenceClassification under torch.inference_mode and returns the full distribution.
+
+    Token ids are written into per-thread preallocated buffers that the model reads without a copy,
+    so a call allocates nothing for its inputs beyond the tokenizer's own output.
+    """
+
+    def __init__(self, model_directory, model=None, tokenizer=None, max_batch_size=32):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self._torch = torch
+        self.tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_directory, use_fast=True)
+        if model is None:
+            model = AutoModelForSequenceClassification.from_pretrained(model_directory, low_cpu_mem_usage=True)
+        self.model = model.eval()
+        id2label = self.model.config.id2label
+        self.labels = tuple(id2label[i] for i in range(len(id2label)))
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_length = min(self.tokenizer.model_max_length, self.model.config.max_position_embeddings - 2)
+        self.pad_token_id = self.tokenizer.pad_token_id
+        self._buffers = threading.local()
+
+    def _input_buffers(self):
+        # One pair per thread: the inference queue worker and long-text requests may run concurrently.
+        buffers = getattr(self._buffers, "arrays", None)
+        if buffers is None:
+            shape = (self.max_batch_size, self.max_length)
+            buffers = self._buffers.arrays = (np.empty(shape, dtype=np.int64), np.empty(shape, dtype=np.int64))
+        return buffers
+
+    def predict_proba(self, texts, truncation=True):
+        """Returns a (len(texts), len(labels)) float32 array of softmax probabilities.
+
+        Inputs are always truncated to the model's maximum length, whatever truncation says.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        if len(texts) > self.max_batch_size:
+            return np.concatenate([self.predict_proba(texts[i:i + self.max_batch_size], truncation)
+                                   for i in range(0, len(texts), self.max_batch_size)])
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)["input_ids"]
+        width = max(len(ids) for ids in encoded)
+        input_ids, attention_mask = self._input_buffers()
+        input_ids = input_ids[:len(encoded), :width]
+        attention_mask = attention_mask[:len(encoded), :width]
+        input_ids.fill(self.pad_token_id)
+        attention_mask.fill(0)
+        for row, ids in enumerate(encoded):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+
+        torch = self._torch
+        with torch.inference_mode():
+            logits = self.model(
+                input_ids=torch.from_numpy(input_ids), attention_mask=torch.from_numpy(attention_mask)
+            ).logits
+            return torch.softmax(logits.float(), dim=-1).numpy()
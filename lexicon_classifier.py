@@ -0,0 +1,56 @@
+"""Keyword-lexicon emotion scorer: a fast, approximate stand-in for the model when it is overloaded."""
+import re
+
+import numpy as np
+
+from lean_classifier import ProbabilityClassifier
+
+# Common mood words per label. Labels the model has but this table lacks simply get no keywords.
+EMOTION_KEYWORDS = {
+    "anger": ("angry", "anger", "furious", "mad", "annoyed", "irritated", "hate", "rage", "frustrated",
+              "pissed", "outraged", "resent", "bitter", "fed up", "livid", "hostile"),
+    "fear": ("afraid", "scared", "fear", "terrified", "anxious", "nervous", "worried", "worry", "panic",
+             "frightened", "uneasy", "dread", "tense", "insecure", "overwhelmed", "stressed"),
+    "joy": ("happy", "joy", "glad", "great", "excited", "cheerful", "delighted", "energetic", "awesome",
+            "wonderful", "fantastic", "good", "amazing", "fun", "proud", "thrilled", "content"),
+    "love": ("love", "loved", "loving", "adore", "romantic", "crush", "caring", "affection", "sweetheart",
+             "darling", "tender", "cherish", "heart", "miss you", "passionate", "fond"),
+    "sadness": ("sad", "unhappy", "depressed", "lonely", "cry", "crying", "tears", "miserable", "heartbroken",
+                "down", "hopeless", "gloomy", "grief", "hurt", "empty", "tired", "lost"),
+    "surprise": ("surprised", "surprise", "shocked", "amazed", "astonished", "unexpected", "wow",
+                 "stunned", "unbelievable", "can't believe", "speechless", "startled", "sudden"),
+}
+
+
+class LexiconClassifier(ProbabilityClassifier):
+    """Scores texts by counting keyword hits per label, in microseconds and without any model files.
+
+    All keywords are compiled into one alternation regex, so scoring a text is a single scan.
+    Texts without any hits get a uniform distribution; check hits() first to tell them apart.
+    """
+
+    def __init__(self, labels, keywords=None, smoothing=0.1):
+        self.labels = tuple(labels)
+        keywords = EMOTION_KEYWORDS if keywords is None else keywords
+        self._label_by_keyword = {}
+        for index, label in enumerate(self.labels):
+            for keyword in keywords.get(label.lower(), ()):
+                self._label_by_keyword.setdefault(keyword.lower(), index)
+        # Longest first so multi-word keywords win over the single words they contain.
+        alternation = "|".join(re.escape(k) for k in sorted(self._label_by_keyword, key=len, reverse=True))
+        self._pattern = re.compile(rf"\b(?:{alternation})\b") if alternation else None
+        self.smoothing = smoothing
+
+    def hits(self, text):
+        """Number of keyword matches in text; 0 means the scores carry no information."""
+        return 0 if self._pattern is None else sum(1 for _ in self._pattern.finditer(text.lower()))
+
+    def predict_proba(self, texts, truncation=True):
+        """Returns a (len(texts), len(labels)) float32 array of normalized keyword scores."""
+        texts = list(texts)
+        counts = np.full((len(texts), len(self.labels)), self.smoothing, dtype=np.float32)
+        if self._pattern is not None:
+            for row, text in enumerate(texts):
+                for match in self._pattern.finditer(text.lower()):
+                    counts[row, self._label_by_keyword[match.group(0)]] += 1.0
+        return counts / counts.sum(axis=1, keepdims=True)
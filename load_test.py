@@ -0,0 +1,362 @@
+"""Concurrent-session load test for app.py, driven through Streamlit's AppTest.
+
+Every simulated session runs the real script flow in this process: it types a mood, clicks
+"Get My Playlist!", switches the playlist language and submits the feedback form. Sessions run on
+threads, so they share the app's process-wide resources (model, inference queue, caches, feedback
+writer) exactly as the sessions of one replica do. AppTest itself assumes one run at a time, so the
+sessions share a single Streamlit runtime and secrets object (see _shared_streamlit_globals). Google
+Sheets is replaced by an in-process fake; the model is a latency-configurable stub by default:
+
+    python load_test.py --concurrency 1,4,16,32 --model-latency-ms 40
+    python load_test.py --model real --concurrency 1,8 --output capacity.json
+    python load_test.py --baseline capacity.json --threshold 0.2
+
+Throughput, per-action latency percentiles and peak RSS are reported for each concurrency level.
+The feedback spool and prediction cache live in a fresh temporary directory, never the app's own files.
+
+AppTest reruns the whole script for every interaction; it has no fragment-scoped reruns. The
+language_switch and feedback_submit latencies therefore measure full-page reruns, an upper bound on
+what a browser session pays for those actions, where only the playlist or feedback fragment reruns.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from unittest import mock
+
+from benchmark import summarize
+from fake_sheets import FakeGspreadClient
+from lexicon_classifier import LexiconClassifier
+from startup import read_emotion_labels
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+MODEL_PATH = "./emosic_emotion_classifier_model"
+GOOGLE_SHEET_NAME = "EmoSic_Feedback"
+ACTIONS = ("page_load", "classify", "language_switch", "feedback_submit")
+# Actions that only rerun a fragment in the browser but a full script run under AppTest.
+FRAGMENT_ACTIONS = ("language_switch", "feedback_submit")
+# Just enough for google_sheet_credentials(); the fake client never looks at them.
+FAKE_SECRETS = {
+    "gcp_service_account_type": "service_account",
+    "gcp_service_account_project_id": "emosic-load-test",
+    "gcp_service_account_private_key": "fake-key",
+    "gcp_service_account_client_email": "load-test@emosic.invalid",
+}
+MOODS = [
+    "I feel so energetic and happy today!",
+    "I'm worried about my exams and can't sleep.",
+    "I miss my best friend so much, it hurts.",
+    "Wow, I did not expect that at all!",
+    "Everyone keeps ignoring me and I'm furious.",
+    "Spending the evening with the people I love.",
+]
+
+
+class StubClassifier(LexiconClassifier):
+    """Stands in for the model: keyword-based scores after a fixed plus per-text delay.
+
+    The real tokenizer is loaded (it is small) because the long-text path needs token offsets.
+    """
+
+    def __init__(self, model_directory, latency_ms=30.0, per_text_ms=2.0):
+        from transformers import AutoTokenizer
+
+        super().__init__(read_emotion_labels(model_directory))
+        self.tokenizer = AutoTokenizer.from_pretrained(model_directory)
+        # Keeps stub predictions out of the real model's entries in the shared prediction cache.
+        self.fingerprint = f"load-test-stub-{latency_ms}-{per_text_ms}"
+        self.latency = latency_ms / 1000.0
+        self.per_text = per_text_ms / 1000.0
+
+    def predict_proba(self, texts, truncation=True):
+        texts = list(texts)
+        time.sleep(self.latency + self.per_text * len(texts))
+        return super().predict_proba(texts, truncation)
+
+
+class _RssSampler:
+    """Tracks the highest resident set size seen while it runs, in MiB."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_mib = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="emosic-rss-sampler", daemon=True)
+
+    @staticmethod
+    def current_mib():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+        except OSError:
+            # No /proc (macOS): fall back to the lifetime peak, which is reported in bytes there.
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 20
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mib = max(self.peak_mib, self.current_mib())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mib = max(self.peak_mib, self.current_mib())
+
+
+def _shared_streamlit_globals():
+    """Patches that let AppTest sessions run on several threads at once.
+
+    Every AppTest run installs its own Runtime singleton, st.secrets and "global.appTest" config
+    patch and undoes all three when it finishes, which breaks any other session still running: with
+    no runtime it hangs until its timeout, and without the config patch its widgets aren't registered
+    for testing (a later KeyError for the widget id). Instead, all three are installed once for the
+    whole load test and the per-run swaps are disabled. Runs also share one script cache, so app.py is
+    compiled once, as the server does, rather than on several threads at once (which CPython 3.11 can
+    fail at).
+    """
+    import types
+
+    import streamlit
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1.util import patch_config_options
+
+    runtime = mock.MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    secrets = Secrets()
+    secrets._secrets = dict(FAKE_SECRETS)
+    return [
+        patch_config_options({"global.appTest": True}),
+        mock.patch("streamlit.testing.v1.app_test.patch_config_options", lambda overrides: contextlib.nullcontext()),
+        mock.patch.object(Runtime, "_instance", runtime),
+        mock.patch("streamlit.testing.v1.app_test.Runtime", types.SimpleNamespace(_instance=None)),
+        mock.patch.object(streamlit, "secrets", secrets),
+        mock.patch("streamlit.testing.v1.local_script_runner.ScriptCache", return_value=ScriptCache()),
+    ]
+
+
+def new_session(timeout):
+    from streamlit.testing.v1 import AppTest
+
+    # No per-session secrets: AppTest would swap st.secrets for every run (see _shared_streamlit_globals).
+    return AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+
+def wait_until_ready(timeout):
+    """Runs one session until the model has loaded, so the timed sessions don't measure startup."""
+    at = new_session(timeout)
+    at.run()
+    deadline = time.monotonic() + timeout
+    while at.button(key="get_playlist_button").disabled:
+        if at.exception:
+            raise RuntimeError(f"app.py failed while loading: {at.exception[0].message}")
+        if time.monotonic() > deadline:
+            raise TimeoutError("Model did not become ready for the load test")
+        time.sleep(0.5)
+        at.run()
+
+
+def _submit_button(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(f"No button labelled {label!r}")
+
+
+def run_session(iterations, timeout, text_ids, record, record_harness_error, rng):
+    """One simulated user: loads the page once, then classifies, switches language and sends feedback.
+
+    record(action, seconds, error) gets every timed action, with the exception app.py raised, if any.
+    An exception from AppTest or this driver ends the session and goes to record_harness_error instead,
+    since it says nothing about the app's capacity.
+    """
+    def timed(action, step):
+        start = time.perf_counter()
+        at = step()
+        error = at.exception[0].message if at.exception else None
+        record(action, time.perf_counter() - start, error)
+        return error is None
+
+    try:
+        _run_session_steps(iterations, timeout, text_ids, timed, rng)
+    except Exception as e:
+        frame = traceback.extract_tb(e.__traceback__)[-1]
+        record_harness_error(f"{type(e).__name__}: {e} ({os.path.basename(frame.filename)}:{frame.lineno})")
+
+
+def _run_session_steps(iterations, timeout, text_ids, timed, rng):
+    at = new_session(timeout)
+    if not timed("page_load", at.run):
+        return
+    for _ in range(iterations):
+        # A fresh text per click keeps the prediction cache from answering instead of the model.
+        text = f"{rng.choice(MOODS)} ({next(text_ids)})"
+        at.text_area(key="emotion_text_area").input(text)
+        if not timed("classify", at.button(key="get_playlist_button").click().run):
+            return
+
+        # The language picker only appears when the emotion has songs.
+        if any(selectbox.key == "main_lang_choice" for selectbox in at.selectbox):
+            language = at.selectbox(key="main_lang_choice")
+            timed("language_switch", language.select(rng.choice(language.options)).run)
+
+        at.radio(key="emotion_accuracy_radio").set_value(rng.choice(at.radio(key="emotion_accuracy_radio").options))
+        at.text_area(key="comments_text_area").input("Load test feedback")
+        timed("feedback_submit", _submit_button(at, "📬 Submit Feedback").click().run)
+
+
+def run_level(concurrency, iterations, timeout, seed, text_ids):
+    """Runs concurrency sessions at once and summarizes them."""
+    durations = {action: [] for action in ACTIONS}
+    errors = []
+    harness_errors = []
+    lock = threading.Lock()
+
+    def record(action, seconds, error):
+        with lock:
+            durations[action].append(seconds)
+            if error:
+                errors.append(f"{action}: {error}")
+
+    def record_harness_error(error):
+        with lock:
+            harness_errors.append(error)
+
+    threads = [
+        threading.Thread(target=run_session, name=f"emosic-load-session-{i}",
+                         args=(iterations, timeout, text_ids, record, record_harness_error, random.Random(seed + i)))
+        for i in range(concurrency)
+    ]
+    with _RssSampler() as rss:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    completed = sum(len(d) for d in durations.values())
+    return {
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "actions_per_s": completed / elapsed if elapsed else 0.0,
+        "classifications_per_s": len(durations["classify"]) / elapsed if elapsed else 0.0,
+        "peak_rss_mib": rss.peak_mib,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        # Sessions cut short by the test harness rather than the app; they don't count against the SLO.
+        "harness_errors": len(harness_errors),
+        "harness_error_samples": harness_errors[:5],
+        "actions": {action: summarize(d) for action, d in durations.items() if d},
+    }
+
+
+def compare(levels, baseline, threshold):
+    """Returns a description of every (concurrency, action) whose p95 grew by more than threshold."""
+    previous = {(level["concurrency"], action): stats["p95_ms"]
+                for level in baseline["levels"] for action, stats in level["actions"].items()}
+    regressions = []
+    for level in levels:
+        for action, stats in level["actions"].items():
+            old = previous.get((level["concurrency"], action))
+            if old and stats["p95_ms"] > old * (1 + threshold):
+                regressions.append(f"{action} at concurrency {level['concurrency']}: "
+                                   f"p95 {old:.1f}ms -> {stats['p95_ms']:.1f}ms")
+    return regressions
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the EmoSic Streamlit app.")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--iterations", type=int, default=5, help="Classify/switch/feedback rounds per session.")
+    parser.add_argument("--model", choices=["stub", "synthetic", "real"], default="stub",
+                        help="stub: fixed-latency keyword scorer; synthetic: random weights; real: the trained model.")
+    parser.add_argument("--model-latency-ms", type=float, default=30.0, help="Stub latency per model call.")
+    parser.add_argument("--model-per-text-ms", type=float, default=2.0, help="Extra stub latency per text in a batch.")
+    parser.add_argument("--sheets-latency-ms", type=float, default=200.0, help="Fake Google Sheets latency per call.")
+    parser.add_argument("--slo-p95-ms", type=float, default=1000.0, help="p95 classify latency target.")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds allowed per script run.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test_results.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Allowed relative p95 growth.")
+    args = parser.parse_args(argv)
+
+    sheets = FakeGspreadClient(GOOGLE_SHEET_NAME, latency_ms=args.sheets_latency_ms)
+    patches = _shared_streamlit_globals() + [mock.patch("gspread.service_account_from_dict", return_value=sheets)]
+    if args.model == "stub":
+        stub = StubClassifier(MODEL_PATH, args.model_latency_ms, args.model_per_text_ms)
+        patches.append(mock.patch("startup.load_emotion_model", return_value=stub))
+    elif args.model == "synthetic":
+        os.environ["EMOSIC_SYNTHETIC_MODEL"] = "1"
+    scratch = tempfile.mkdtemp(prefix="emosic-load-test-")
+    os.environ["EMOSIC_FEEDBACK_SPOOL_PATH"] = os.path.join(scratch, "feedback_spool.sqlite3")
+    os.environ["EMOSIC_PREDICTION_CACHE_PATH"] = os.path.join(scratch, "prediction_cache.sqlite3")
+
+    # Unique across levels, so the prediction cache never answers instead of the model. Unlike a
+    # generator, map over count can be advanced from several session threads at once.
+    text_ids = map(f"{time.time_ns():x}-{{}}".format, itertools.count())
+    levels = []
+    with contextlib.ExitStack() as stack:
+        for patch in patches:
+            stack.enter_context(patch)
+        wait_until_ready(args.timeout)
+        for concurrency in args.concurrency:
+            level = run_level(concurrency, args.iterations, args.timeout, args.seed, text_ids)
+            levels.append(level)
+            classify = level["actions"].get("classify", {})
+            print(f"concurrency={concurrency:>4}: {level['actions_per_s']:.1f} actions/s, "
+                  f"{level['classifications_per_s']:.1f} classifications/s, "
+                  f"classify p50={classify.get('p50_ms', 0):.0f}ms p95={classify.get('p95_ms', 0):.0f}ms "
+                  f"p99={classify.get('p99_ms', 0):.0f}ms, peak RSS {level['peak_rss_mib']:.0f} MiB, "
+                  f"{level['errors']} errors")
+            for error in level["harness_error_samples"]:
+                print(f"  harness error (not counted against the SLO): {error}")
+
+    within_slo = [level["concurrency"] for level in levels
+                  if level["actions"].get("classify", {}).get("p95_ms", float("inf")) <= args.slo_p95_ms
+                  and not level["errors"]]  # App errors only; harness errors are reported separately.
+    report = {
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "max_concurrency_within_slo": max(within_slo, default=None),
+        "sheet_rows_written": len(sheets.worksheet.rows),
+        "full_rerun_actions": list(FRAGMENT_ACTIONS),
+        "levels": levels,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Highest concurrency with classify p95 <= {args.slo_p95_ms:.0f}ms: {report['max_concurrency_within_slo']}")
+    print(f"Note: {', '.join(FRAGMENT_ACTIONS)} are timed as full script reruns; AppTest has no fragment reruns.")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(levels, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
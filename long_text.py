@@ -0,0 +1,101 @@
+"""Sliding-window classification for inputs longer than one model window."""
+import copy
+import threading
+import time
+
+import numpy as np
+
+AGGREGATIONS = ("mean", "max", "weighted")
+# Upper bound on characters per token, used to cut huge pastes before tokenizing them at all.
+MAX_CHARS_PER_TOKEN = 16
+
+
+class LongTextClassifier:
+    """Splits long text into overlapping token windows and classifies them as one batch."""
+
+    def __init__(self, classifier, window_tokens=256, stride_tokens=192, max_tokens=1024, aggregation="weighted",
+                 queue=None):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"aggregation must be one of {AGGREGATIONS}, got {aggregation!r}")
+        self.classifier = classifier
+        # With an InferenceQueue, windows are batched with other requests and classify() can time out.
+        self.queue = queue
+        self.aggregation = aggregation
+        # Sessions call windows() concurrently and a fast tokenizer can't be used from two threads at once
+        # ("Already borrowed"), so they share a private copy under a lock instead of the classifier's own.
+        self.tokenizer = copy.deepcopy(classifier.tokenizer)
+        self._tokenizer_lock = threading.Lock()
+        # Leave room for the <s> and </s> tokens the classifier adds to every window.
+        limit = self.tokenizer.model_max_length - 2
+        self.window_tokens = max(1, min(int(window_tokens), limit))
+        self.stride_tokens = max(1, min(int(stride_tokens), self.window_tokens))
+        self.max_tokens = max(self.window_tokens, int(max_tokens))
+
+    def token_offsets(self, text):
+        """Character offsets of text's tokens, without special tokens and at most max_tokens of them.
+
+        Tokenizing is the costly part of is_long() and windows(); callers that need both (or the token
+        count) compute this once and pass it in.
+        """
+        text = text[:self.max_tokens * MAX_CHARS_PER_TOKEN]
+        with self._tokenizer_lock:
+            encoded = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        # Hard per-request budget: tokens past max_tokens are never classified.
+        return encoded["offset_mapping"][:self.max_tokens]
+
+    def is_long(self, text, offsets=None):
+        """True when text does not fit in a single window."""
+        return len(self.token_offsets(text) if offsets is None else offsets) > self.window_tokens
+
+    def windows(self, text, offsets=None):
+        """Returns (window_text, token_count) pairs covering at most max_tokens tokens of text."""
+        if offsets is None:
+            offsets = self.token_offsets(text)
+        if not offsets:
+            return [(text[:self.max_tokens * MAX_CHARS_PER_TOKEN], 0)]
+        windows = []
+        start = 0
+        while True:
+            end = min(start + self.window_tokens, len(offsets))
+            windows.append((text[offsets[start][0]:offsets[end - 1][1]], end - start))
+            if end == len(offsets):
+                return windows
+            start += self.stride_tokens
+
+    def classify(self, text, timeout=None, offsets=None):
+        """Returns every label with its aggregated score, highest first, like the pipeline with top_k=None.
+
+        With a queue, raises TimeoutError if the windows aren't all classified within timeout seconds.
+        """
+        windows = self.windows(text, offsets)
+        if self.queue is None:
+            outputs = self.classifier([w for w, _ in windows], batch_size=len(windows), truncation=True, top_k=None)
+        else:
+            outputs = self._classify_queued(windows, timeout)
+        labels = sorted(p["label"] for p in outputs[0])
+        probs = np.array([[{p["label"]: p["score"] for p in output}[label] for label in labels]
+                          for output in outputs], dtype=np.float32)
+
+        if self.aggregation == "max":
+            scores = probs.max(axis=0)
+            scores /= scores.sum()
+        elif self.aggregation == "weighted":
+            weights = np.array([max(count, 1) for _, count in windows], dtype=np.float32)
+            scores = weights @ probs / weights.sum()
+        else:
+            scores = probs.mean(axis=0)
+        order = np.argsort(scores)[::-1]
+        return [{"label": labels[i], "score": float(scores[i])} for i in order]
+
+    def _classify_queued(self, windows, timeout):
+        # Each window's token count is known, plus the <s> and </s> tokens, so the queue needn't tokenize again.
+        futures = [self.queue.submit(text, length=count + 2) for text, count in windows]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            return [future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                    for future in futures]
+        except TimeoutError:
+            # Withdraw the windows the worker hasn't started yet.
+            for future in futures:
+                future.cancel()
+            raise
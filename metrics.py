@@ -0,0 +1,237 @@
+"""Fixed-memory, in-process metrics for the request path, exportable in Prometheus text format."""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; spans sub-millisecond cache hits up to multi-second Sheets round trips.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """Holds a value set by the caller, or reads it from fn at export time."""
+
+    def __init__(self, fn=None):
+        self.fn = fn
+        self._value = 0.0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        if self.fn is None:
+            return self._value
+        try:
+            return self.fn()
+        except Exception:
+            return float("nan")
+
+
+class Histogram:
+    """Cumulative-bucket histogram: memory is one counter per bucket no matter how many observations."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def percentile(self, q):
+        """Bucket upper bound below which a fraction q of the observations fall (inf past the last bucket)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Get-or-create store of named metrics; each name has one type and help text and any number of label sets."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._meta = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, factory, name, help_text, labels):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    self._meta.setdefault(name, (kind, help_text))
+                    metric = self._metrics[key] = factory()
+        return metric
+
+    def counter(self, name, help_text="", **labels):
+        return self._get("counter", Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text="", fn=None, **labels):
+        gauge = self._get("gauge", Gauge, name, help_text, labels)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name, help_text="", **labels):
+        return self._get("histogram", Histogram, name, help_text, labels)
+
+    @contextmanager
+    def timer(self, name, help_text="", **labels):
+        """Observes the duration of the with-block, including when it raises."""
+        histogram = self.histogram(name, help_text, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def items(self):
+        """(name, labels, kind, metric) for every metric, sorted by name."""
+        with self._lock:
+            entries = sorted(self._metrics.items())
+        return [(name, labels, self._meta[name][0], metric) for (name, labels), metric in entries]
+
+    def render_prometheus(self):
+        """Returns every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        described = set()
+        for name, labels, kind, metric in self.items():
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {self._meta[name][1]}")
+                lines.append(f"# TYPE {name} {kind}")
+            if kind != "histogram":
+                lines.append(f"{name}{_label_text(labels)} {metric.value}")
+                continue
+            with metric._lock:
+                counts, total, seconds = list(metric.counts), metric.count, metric.sum
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {seconds}")
+            lines.append(f"{name}_count{_label_text(labels)} {total}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by every module on the request path.
+REGISTRY = MetricsRegistry()
+
+STAGE_METRIC = "emosic_stage_seconds"
+STAGE_HELP = "Latency of each stage on the request path, in seconds."
+
+
+def stage_histogram(stage):
+    """The shared per-stage latency histogram for one stage."""
+    return REGISTRY.histogram(STAGE_METRIC, STAGE_HELP, stage=stage)
+
+
+def stage_timer(stage):
+    """Context manager timing one stage into the shared per-stage latency histogram."""
+    return REGISTRY.timer(STAGE_METRIC, STAGE_HELP, stage=stage)
+
+
+def error_counter(component):
+    return REGISTRY.counter("emosic_errors_total", "Errors on the request path, by component.", component=component)
+
+
+class RunTimer:
+    """Counts one Streamlit script or fragment run and the thread CPU time it used, by scope.
+
+    Comparing the "script" scope against the fragment scopes shows how many interactions were
+    served without a full-script rerun.
+    """
+
+    def __init__(self, scope):
+        self.runs = REGISTRY.counter("emosic_runs_total", "Streamlit script and fragment runs, by scope.", scope=scope)
+        self.cpu = REGISTRY.counter(
+            "emosic_run_cpu_seconds_total", "Thread CPU time spent in script and fragment runs, by scope.", scope=scope
+        )
+        self._start = None
+
+    @property
+    def running(self):
+        """True between start() and stop()."""
+        return self._start is not None
+
+    def start(self):
+        self.runs.inc()
+        self._start = time.thread_time()
+        return self
+
+    def stop(self):
+        if self._start is not None:
+            self.cpu.inc(time.thread_time() - self._start)
+            self._start = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=REGISTRY):
+    """Serves GET /metrics from a daemon thread; returns the server, or None if the port is taken."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        # Usually another process on this host took the port; this process's metrics are then unreachable.
+        logger.warning("Metrics endpoint not started on %s:%s: %s; give each process its own port", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="emosic-metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,135 @@
+"""ONNX Runtime CPU backend for the emotion classifier, using int8 dynamic quantization.
+
+Build the quantized model once and check it against the PyTorch model:
+
+    python onnx_backend.py export
+    python onnx_backend.py check
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from lean_classifier import ProbabilityClassifier, compare_predictions
+from prediction_cache import model_fingerprint
+
+FP32_FILE_NAME = "model.onnx"
+INT8_FILE_NAME = "model.int8.onnx"
+
+# Short mood sentences covering all six labels, used when no sample file is given to the parity check.
+DEFAULT_PARITY_SAMPLES = [
+    "I feel so energetic and happy today!",
+    "Everything is going wrong and I can't stop crying.",
+    "I am furious that they cancelled my flight again.",
+    "I'm scared of walking home alone at night.",
+    "I love spending quiet evenings with my family.",
+    "Wow, I did not expect to win the lottery!",
+    "i am happy",
+    "I'm so sad",
+    "My heart is full when I think about you.",
+    "The noise outside is making me really irritated.",
+    "I'm nervous about the exam tomorrow morning.",
+    "I can't believe they threw me a surprise party!",
+]
+
+
+def export_quantized_model(model_directory, onnx_directory, opset_version=17):
+    """Exports the PyTorch model to ONNX and writes an int8 dynamically-quantized copy next to it."""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(onnx_directory, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_directory)
+    model = AutoModelForSequenceClassification.from_pretrained(model_directory)
+    model.eval()
+
+    sample = tokenizer(DEFAULT_PARITY_SAMPLES[:2], padding=True, return_tensors="pt")
+    fp32_path = os.path.join(onnx_directory, FP32_FILE_NAME)
+    # no_grad rather than inference_mode: the TorchScript tracer behind torch.onnx.export can't
+    # trace inference tensors ("Inference tensors do not track version counter").
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset_version,
+        )
+    int8_path = os.path.join(onnx_directory, INT8_FILE_NAME)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    # The ONNX directory is self-contained: the backend reads labels and tokenizer files from it.
+    tokenizer.save_pretrained(onnx_directory)
+    model.config.save_pretrained(onnx_directory)
+    # Hash the new files now rather than on the first app start (see model_fingerprint).
+    model_fingerprint(onnx_directory)
+    return int8_path
+
+
+class OnnxEmotionClassifier(ProbabilityClassifier):
+    """Drop-in replacement for the transformers text-classification pipeline backed by ONNX Runtime."""
+
+    def __init__(self, onnx_directory, model_file=INT8_FILE_NAME, intra_op_threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_directory)
+        with open(os.path.join(onnx_directory, "config.json"), encoding="utf-8") as f:
+            id2label = json.load(f)["id2label"]
+        self.labels = [id2label[str(i)] for i in range(len(id2label))]
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+        self.session = ort.InferenceSession(
+            os.path.join(onnx_directory, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def predict_proba(self, texts, truncation=True):
+        """Returns a (len(texts), num_labels) float32 array of softmax probabilities."""
+        encoded = self.tokenizer(list(texts), padding=True, truncation=truncation, return_tensors="np")
+        feeds = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        logits = self.session.run(["logits"], feeds)[0]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return (probs / probs.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def parity_check(model_directory, onnx_directory, samples=None):
+    """Compares the quantized ONNX model against the PyTorch pipeline on a sample set."""
+    from transformers import pipeline
+
+    reference = pipeline("sentiment-analysis", model=model_directory, tokenizer=model_directory)
+    return compare_predictions(reference, OnnxEmotionClassifier(onnx_directory), samples or DEFAULT_PARITY_SAMPLES)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and verify the quantized ONNX emotion classifier.")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--model-dir", default="./emosic_emotion_classifier_model")
+    parser.add_argument("--onnx-dir", default="./emosic_emotion_classifier_onnx")
+    parser.add_argument("--samples", help="Text file with one parity sample per line.")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(f"Wrote {export_quantized_model(args.model_dir, args.onnx_dir)}")
+        return
+    samples = None
+    if args.samples:
+        with open(args.samples, encoding="utf-8") as f:
+            samples = [line.strip() for line in f if line.strip()]
+    print(json.dumps(parity_check(args.model_dir, args.onnx_dir, samples), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Song catalog loaded from a CSV data file into compact columns with an (emotion, language) index.
+
+Besides the required columns, the file may carry one numeric column per emotion label (anger, fear,
+joy, ...) giving a track's affinity to that emotion; rows without any get a one-hot affinity for
+their emotion column.
+"""
+import csv
+import logging
+import os
+import threading
+import time
+from array import array
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CATALOG_COLUMNS = ("emotion", "language", "title", "url")
+
+
+class _StringColumn:
+    """Strings packed into one UTF-8 blob plus an offsets array: two allocations however many rows there are."""
+
+    def __init__(self):
+        self._blob = bytearray()
+        self._offsets = array("q", [0])
+
+    def append(self, value):
+        self._blob += value.encode("utf-8")
+        self._offsets.append(len(self._blob))
+
+    def freeze(self):
+        self._blob = bytes(self._blob)
+        self._offsets = np.frombuffer(self._offsets, dtype=np.int64)
+        return self
+
+    def __getitem__(self, row):
+        return self._blob[self._offsets[row]:self._offsets[row + 1]].decode("utf-8")
+
+
+class _CatalogSnapshot:
+    """One immutable load of the data file; readers keep using it while a reload builds the next one."""
+
+    def __init__(self, path, labels):
+        self.mtime = os.stat(path).st_mtime_ns
+        self.labels = tuple(labels)
+        self.titles = _StringColumn()
+        self.urls = _StringColumn()
+        self.emotions = []
+        self.languages = []
+        emotion_codes = array("B")
+        language_codes = array("B")
+        emotion_index = {}
+        language_index = {}
+        rows_by_key = {}
+        # Per language: unique tracks (by url) with their affinity vectors, flattened row-major.
+        tracks_by_language = {}
+        with open(path, encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            missing = set(CATALOG_COLUMNS) - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"Playlist catalog {path} is missing columns: {sorted(missing)}")
+            affinity_columns = [label for label in self.labels if label in reader.fieldnames]
+            for row_id, record in enumerate(reader):
+                emotion = record["emotion"].strip().lower()
+                language = record["language"].strip()
+                if emotion not in emotion_index:
+                    emotion_index[emotion] = len(self.emotions)
+                    self.emotions.append(emotion)
+                if language not in language_index:
+                    language_index[language] = len(self.languages)
+                    self.languages.append(language)
+                emotion_codes.append(emotion_index[emotion])
+                language_codes.append(language_index[language])
+                self.titles.append(record["title"])
+                self.urls.append(record["url"])
+                rows_by_key.setdefault((emotion, language), array("I")).append(row_id)
+                self._add_track(tracks_by_language, row_id, record, emotion, language, affinity_columns)
+
+        self.titles.freeze()
+        self.urls.freeze()
+        self.emotion_codes = np.frombuffer(emotion_codes, dtype=np.uint8)
+        self.language_codes = np.frombuffer(language_codes, dtype=np.uint8)
+        self.size = len(self.emotion_codes)
+        self.index = {key: np.frombuffer(rows, dtype=np.uint32) for key, rows in rows_by_key.items()}
+        # Languages per emotion, in the order they first appear in the file.
+        self.languages_by_emotion = {}
+        for emotion, language in self.index:
+            self.languages_by_emotion.setdefault(emotion, []).append(language)
+        # Per language: (row ids, affinity matrix shaped (labels, tracks)). Label-major so scoring a
+        # whole language is one contiguous matrix-vector product.
+        self.affinity_by_language = {}
+        for language, (row_ids, _, affinities) in tracks_by_language.items():
+            matrix = np.frombuffer(affinities, dtype=np.float32).reshape(len(row_ids), len(self.labels))
+            self.affinity_by_language[language] = (
+                np.frombuffer(row_ids, dtype=np.uint32), np.ascontiguousarray(matrix.T)
+            )
+
+    def _add_track(self, tracks_by_language, row_id, record, emotion, language, affinity_columns):
+        vector = [float(record.get(label) or 0.0) for label in self.labels] if affinity_columns else []
+        if not any(vector):
+            vector = [1.0 if label == emotion else 0.0 for label in self.labels]
+        row_ids, positions, affinities = tracks_by_language.setdefault(language, (array("I"), {}, array("f")))
+        position = positions.get(record["url"])
+        if position is None:
+            positions[record["url"]] = len(row_ids)
+            row_ids.append(row_id)
+            affinities.extend(vector)
+            return
+        # The same song listed under several emotions is one track with the combined affinity.
+        start = position * len(self.labels)
+        for i, value in enumerate(vector):
+            affinities[start + i] = max(affinities[start + i], value)
+
+
+class PlaylistCatalog:
+    """Indexed song catalog that reloads itself in the background when the data file's mtime changes.
+
+    Lookups cost O(result size): the (emotion, language) index maps straight to row ids, and only
+    the rows on the requested page are decoded.
+    """
+
+    def __init__(self, path, labels=(), reload_check_interval=1.0):
+        self.path = path
+        self.labels = tuple(labels)
+        self.reload_check_interval = reload_check_interval
+        self._snapshot = _CatalogSnapshot(path, self.labels)
+        self._next_check = time.monotonic() + reload_check_interval
+        self._reload_lock = threading.Lock()
+
+    @property
+    def version(self):
+        """Changes whenever a reload picks up a new version of the data file."""
+        return self._current().mtime
+
+    def _current(self):
+        now = time.monotonic()
+        if now >= self._next_check and self._reload_lock.acquire(blocking=False):
+            # Only one thread checks; a changed file is loaded on a background thread while every
+            # request keeps reading the old snapshot, so no request waits for a reload.
+            self._next_check = now + self.reload_check_interval
+            try:
+                changed = os.stat(self.path).st_mtime_ns != self._snapshot.mtime
+            except OSError as e:
+                logger.warning("Keeping the previous playlist catalog; can't stat %s: %s", self.path, e)
+                changed = False
+            if changed:
+                threading.Thread(target=self._reload, name="emosic-catalog-reload", daemon=True).start()
+            else:
+                self._reload_lock.release()
+        return self._snapshot
+
+    def _reload(self):
+        try:
+            self._snapshot = _CatalogSnapshot(self.path, self.labels)
+            logger.info("Reloaded playlist catalog %s (%d songs)", self.path, self._snapshot.size)
+        except (OSError, ValueError, csv.Error) as e:
+            logger.warning("Keeping the previous playlist catalog; reloading %s failed: %s", self.path, e)
+        finally:
+            # Checked again only after this load, so a slow reload never overlaps the next one.
+            self._next_check = time.monotonic() + self.reload_check_interval
+            self._reload_lock.release()
+
+    def snapshot(self):
+        """The current immutable load of the data file (reloading it first if it changed)."""
+        return self._current()
+
+    def emotions(self):
+        return list(self._current().languages_by_emotion)
+
+    def languages(self, emotion):
+        """Languages that have at least one song for emotion."""
+        return list(self._current().languages_by_emotion.get(emotion, []))
+
+    def count(self, emotion, language):
+        rows = self._current().index.get((emotion, language))
+        return 0 if rows is None else len(rows)
+
+    def songs(self, row_ids, snapshot=None):
+        """Decodes the given rows into {'id', 'title', 'url'} dicts."""
+        snapshot = snapshot or self._current()
+        return [{"id": int(row), "title": snapshot.titles[row], "url": snapshot.urls[row]} for row in row_ids]
+
+    def page(self, emotion, language, offset=0, limit=10):
+        """Songs offset..offset+limit for (emotion, language), in file order."""
+        snapshot = self._current()
+        rows = snapshot.index.get((emotion, language))
+        if rows is None:
+            return []
+        return self.songs(rows[offset:offset + limit], snapshot)
@@ -0,0 +1,174 @@
+"""Two-tier cache of emotion predictions: an in-process LRU in front of a SQLite store shared by processes."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".onnx")
+# Each file's digest is remembered in this file next to the weights, keyed on size and mtime, so a restart
+# only rehashes files that changed. A read-only model directory simply hashes every time.
+FINGERPRINT_MEMO_NAME = ".emosic_fingerprint.json"
+# Expired rows and rows from other models are deleted on startup and after every this many puts.
+PRUNE_EVERY_PUTS = 1000
+
+
+def _file_digest(path, chunk_size):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_fingerprint(model_directory, chunk_size=1 << 20):
+    """Hashes config.json and the weight files, so cached predictions never outlive the model that made them.
+
+    Hashing a few hundred MiB of weights takes seconds, so unchanged files reuse the digest stored in
+    FINGERPRINT_MEMO_NAME instead of being read on every process start.
+    """
+    memo_path = os.path.join(model_directory, FINGERPRINT_MEMO_NAME)
+    try:
+        with open(memo_path, encoding="utf-8") as f:
+            memo = json.load(f)
+    except (OSError, ValueError):
+        memo = {}
+    files = {}
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(model_directory)):
+        if name != "config.json" and (not name.endswith(WEIGHT_SUFFIXES) or name == "training_args.bin"):
+            continue
+        path = os.path.join(model_directory, name)
+        stat = os.stat(path)
+        key = [stat.st_size, stat.st_mtime_ns]
+        remembered = memo.get(name)
+        file_digest = remembered[2] if remembered and remembered[:2] == key else _file_digest(path, chunk_size)
+        files[name] = key + [file_digest]
+        digest.update(name.encode("utf-8"))
+        digest.update(file_digest.encode("ascii"))
+    if files != memo:
+        tmp_path = f"{memo_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(files, f)
+            os.replace(tmp_path, memo_path)
+        except OSError:
+            pass
+    return digest.hexdigest()[:16]
+
+
+def normalize_text(text):
+    """Case-folds and collapses whitespace so trivially different inputs share one entry."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class PredictionCache:
+    """Bounded LRU with TTL backed by a persistent SQLite table keyed on (model fingerprint, text hash).
+
+    The TTL applies to both tiers: an entry expires ttl_seconds after it was first stored, whichever
+    process stored it.
+    """
+
+    def __init__(self, db_path, fingerprint, max_entries=4096, ttl_seconds=3600):
+        self.db_path = db_path
+        self.fingerprint = fingerprint
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+                         "pruned": 0}
+        self._puts = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "fingerprint TEXT NOT NULL, key TEXT NOT NULL, prediction TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (fingerprint, key))"
+            )
+        self.prune()
+
+    def _connection(self):
+        # sqlite3 connections can't cross threads, and every Streamlit session runs in its own thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, text):
+        return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+    def get(self, text):
+        """Returns the cached prediction for text, or None on a miss."""
+        key = self._key(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, prediction = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return prediction
+                del self._memory[key]
+                self.counters["expirations"] += 1
+
+        row = self._connection().execute(
+            "SELECT prediction, created FROM predictions WHERE fingerprint = ? AND key = ? AND created > ?",
+            (self.fingerprint, key, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        prediction, created = json.loads(row[0]), row[1]
+        with self._lock:
+            self.counters["disk_hits"] += 1
+            # Keep it in memory only for what is left of its lifetime on disk.
+            self._remember(key, prediction, now, ttl=created + self.ttl - time.time())
+        return prediction
+
+    def put(self, text, prediction):
+        """Stores a pipeline-shaped prediction in both tiers."""
+        key = self._key(text)
+        with self._lock:
+            self._remember(key, prediction, time.monotonic())
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO predictions (fingerprint, key, prediction, created) VALUES (?, ?, ?, ?)",
+                (self.fingerprint, key, json.dumps(prediction), time.time())
+            )
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % PRUNE_EVERY_PUTS == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Deletes expired rows and rows written by other models; returns how many were deleted."""
+        with self._connection() as conn:
+            deleted = conn.execute(
+                "DELETE FROM predictions WHERE fingerprint != ? OR created <= ?",
+                (self.fingerprint, time.time() - self.ttl)
+            ).rowcount
+        with self._lock:
+            self.counters["pruned"] += deleted
+        return deleted
+
+    def _remember(self, key, prediction, now, ttl=None):
+        self._memory[key] = (now + (self.ttl if ttl is None else ttl), prediction)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def stats(self):
+        """Snapshot of the hit/miss/eviction counters plus the current in-memory size."""
+        with self._lock:
+            return dict(self.counters, memory_entries=len(self._memory))
@@ -0,0 +1,102 @@
+"""Probability-weighted song ranking: every track in a language scored against the predicted emotion mix."""
+import numpy as np
+
+
+class RankingScores:
+    """One request's scores for a language's tracks, so several rank() calls and the count share one scoring pass."""
+
+    def __init__(self, snapshot, row_ids, affinity, eligible, eligible_scores):
+        self.snapshot = snapshot
+        self.row_ids = row_ids
+        self.affinity = affinity
+        # Positions of the tracks above the score cut-off, and their scores.
+        self.eligible = eligible
+        self.eligible_scores = eligible_scores
+
+    def __len__(self):
+        """How many songs rank() can return, before exclusions."""
+        return len(self.eligible)
+
+
+class SongRanker:
+    """Ranks a PlaylistCatalog's tracks by the dot product of their emotion affinity and the prediction.
+
+    Scoring is one matrix-vector product over the language's (labels, tracks) affinity matrix and the
+    top-k selection is an argpartition, so a request stays in the low milliseconds for a million tracks.
+    """
+
+    def __init__(self, catalog, candidate_factor=4, min_score_ratio=0.25):
+        self.catalog = catalog
+        self.labels = catalog.labels
+        # Diversity and jitter re-order a pool this many times larger than k.
+        self.candidate_factor = max(1, int(candidate_factor))
+        # Tracks scoring below this fraction of the best score (or at zero) are never returned, so a
+        # short list for the predicted emotion isn't padded out with songs for unrelated emotions.
+        self.min_score_ratio = min_score_ratio
+
+    def distribution_vector(self, distribution):
+        """Label-ordered float32 vector from a {label: probability} mapping or a single top label."""
+        if isinstance(distribution, str):
+            distribution = {distribution: 1.0}
+        return np.array([distribution.get(label, 0.0) for label in self.labels], dtype=np.float32)
+
+    def score(self, distribution, language):
+        """Scores every track in language against distribution; len() of the result is the eligible count."""
+        snapshot = self.catalog.snapshot()
+        block = snapshot.affinity_by_language.get(language)
+        if block is None:
+            return RankingScores(snapshot, None, None, np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32))
+        row_ids, affinity = block
+        scores = self.distribution_vector(distribution) @ affinity
+        best = float(scores.max()) if len(scores) else 0.0
+        eligible = np.flatnonzero((scores > 0) & (scores >= best * self.min_score_ratio))
+        return RankingScores(snapshot, row_ids, affinity, eligible, scores[eligible])
+
+    def rank(self, distribution, language, k=10, exclude=(), diversity=0.0, jitter=0.0, rng=None, scores=None):
+        """Returns up to k song dicts for language, best first.
+
+        Only tracks scoring at least min_score_ratio of the best score are considered. exclude holds
+        catalog row ids not to return (e.g. recently shown songs). diversity > 0 trades score for
+        songs whose emotion profile differs from those already picked (maximal marginal relevance);
+        jitter adds up to that much random noise to break ties between equal scores. Pass scores from
+        score(distribution, language) to reuse them instead of scoring the catalog again.
+        """
+        if scores is None:
+            scores = self.score(distribution, language)
+        snapshot, row_ids, affinity = scores.snapshot, scores.row_ids, scores.affinity
+        eligible, eligible_scores = scores.eligible, scores.eligible_scores
+        if not len(eligible) or k <= 0:
+            return []
+
+        exclude = set(exclude)
+        pool = k * (self.candidate_factor if diversity or jitter else 1) + len(exclude)
+        pool = min(pool, len(eligible))
+        top = np.argpartition(eligible_scores, len(eligible) - pool)[len(eligible) - pool:]
+        candidates, candidate_scores = eligible[top], eligible_scores[top]
+        if exclude:
+            keep = np.array([int(row_ids[c]) not in exclude for c in candidates], dtype=bool)
+            candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+        if jitter:
+            rng = rng or np.random.default_rng()
+            candidate_scores = candidate_scores + rng.uniform(0.0, jitter, len(candidates)).astype(np.float32)
+
+        if diversity and len(candidates) > k:
+            picked = self._diversify(candidates, candidate_scores, affinity, k, diversity)
+        else:
+            picked = candidates[np.argsort(-candidate_scores, kind="stable")[:k]]
+        return self.catalog.songs(row_ids[picked], snapshot)
+
+    def _diversify(self, candidates, candidate_scores, affinity, k, diversity):
+        vectors = affinity[:, candidates].T
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarity = vectors @ vectors.T
+        chosen = []
+        penalty = np.zeros(len(candidates), dtype=np.float32)
+        available = np.ones(len(candidates), dtype=bool)
+        for _ in range(k):
+            marginal = np.where(available, candidate_scores - diversity * penalty, -np.inf)
+            best = int(np.argmax(marginal))
+            chosen.append(best)
+            available[best] = False
+            penalty = np.maximum(penalty, similarity[best])
+        return candidates[chosen]
@@ -0,0 +1,275 @@
+"""Offline bulk re-classification of exported feedback or any other text, e.g. after a model update.
+
+Streams a CSV or JSONL file through batched inference in worker processes and streams the labelled
+rows out, so memory stays bounded however many rows there are:
+
+    python reclassify.py feedback.csv relabelled.csv --text-column "User Input" --workers 8
+
+Progress is checkpointed next to the output file; rerunning the same command after a crash or kill
+resumes where the last checkpoint left off. Pass --restart to start over instead. For a CSV file
+without a header row, pass --no-header and give --text-column as a zero-based index.
+"""
+import argparse
+import collections
+import csv
+import io
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from startup import classifier_fingerprint, load_emotion_model, read_emotion_labels
+
+logger = logging.getLogger(__name__)
+
+# Columns (CSV) or fields (JSONL) added to every output row.
+PREDICTED_LABEL = "predicted_emotion"
+PREDICTED_SCORE = "predicted_score"
+
+# Set in the parent before forking for PyTorch; each worker finishes its own setup on its first batch.
+_classifier = None
+_worker_ready = False
+
+
+def _classify_batch(texts, model_directory, backend, threads):
+    # Set up lazily rather than in a pool initializer, so a failed model load surfaces as this
+    # task's exception instead of the pool endlessly replacing workers that die on startup.
+    global _classifier, _worker_ready
+    if not _worker_ready:
+        if _classifier is None:
+            _classifier = load_emotion_model(model_directory, backend, intra_op_threads=threads)
+        elif backend != "onnx":
+            import torch
+            torch.set_num_threads(threads)
+        _worker_ready = True
+    return _classifier.predict_proba(texts)
+
+
+def read_records(path, text_column, header=True):
+    """Yields (record, text) for each row of a CSV or JSONL file.
+
+    For CSV, text_column is a header name or a zero-based column index, and the header row itself
+    is yielded first as (header, None); with header=False every row is data and text_column must be
+    an index. For JSONL it is a field name.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record, str(record.get(text_column) or "")
+            return
+        reader = csv.reader(f)
+        if not header:
+            if not text_column.isdigit():
+                raise ValueError(f"{path} has no header row, so the text column must be an index, not {text_column!r}")
+            column = int(text_column)
+        else:
+            header = next(reader, None)
+            if header is None:
+                return
+            if text_column in header:
+                column = header.index(text_column)
+            elif text_column.isdigit() and int(text_column) < len(header):
+                column = int(text_column)
+            else:
+                raise ValueError(f"{path} has no column {text_column!r}; columns are {header}")
+            yield header, None
+        for row in reader:
+            yield row, row[column] if column < len(row) else ""
+
+
+def batched(items, batch_size):
+    """Groups an iterable into lists of up to batch_size items without reading ahead further."""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class _OutputWriter:
+    """Appends labelled rows to the output file and reports its exact size in bytes for checkpoints.
+
+    Input and output formats may differ: CSV rows become JSON objects keyed by the input header (or by
+    column index without one), and JSONL records become CSV rows under the first record's field names.
+    """
+
+    def __init__(self, path, labels, offset):
+        self.path = path
+        self.labels = labels
+        self.is_csv = not path.endswith(".jsonl")
+        # Input column names, set by write_header() or, for JSONL input, from the first record.
+        self.fields = None
+        mode = "r+b" if offset else "wb"
+        self._file = open(path, mode)
+        if offset and self.is_csv:
+            # Resuming: the header row the first run wrote fixes the columns.
+            header = next(csv.reader([self._file.readline().decode("utf-8")]), [])
+            self.fields = header[:len(header) - 2 - len(labels)]
+        # Anything past the checkpointed offset was written after the last checkpoint and is redone.
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def write_header(self, header):
+        """Sets the input column names; a new CSV output starts with them as its header row."""
+        self.fields = list(header)
+        if self.is_csv and self._file.tell() == 0:
+            self._write_csv_row(self.fields + [PREDICTED_LABEL, PREDICTED_SCORE] + list(self.labels))
+
+    def write(self, records, probs):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if self.is_csv else None
+        for record, row in zip(records, probs):
+            best = int(row.argmax())
+            if self.is_csv:
+                if isinstance(record, dict):
+                    if self.fields is None:
+                        self.write_header(record)
+                    record = [_csv_value(record.get(field)) for field in self.fields]
+                writer.writerow(list(record) + [self.labels[best], f"{row[best]:.6f}"] + [f"{p:.6f}" for p in row])
+            else:
+                if isinstance(record, dict):
+                    labelled = dict(record)
+                elif self.fields is not None:
+                    labelled = dict(zip(self.fields, record))
+                else:
+                    labelled = {str(i): value for i, value in enumerate(record)}
+                labelled[PREDICTED_LABEL] = self.labels[best]
+                labelled[PREDICTED_SCORE] = float(row[best])
+                labelled["emotion_scores"] = {label: float(p) for label, p in zip(self.labels, row)}
+                buffer.write(json.dumps(labelled, ensure_ascii=False) + "\n")
+        self._file.write(buffer.getvalue().encode("utf-8"))
+
+    def _write_csv_row(self, row):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(row)
+        self._file.write(buffer.getvalue().encode("utf-8"))
+
+    def sync(self):
+        """Flushes to disk and returns the file size, which a checkpoint can safely record."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+def _csv_value(value):
+    # Nested JSON values stay JSON in a CSV cell rather than becoming Python reprs.
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+
+
+def _load_checkpoint(path, fingerprint, restart):
+    if restart or not os.path.exists(path):
+        return {"rows_done": 0, "output_bytes": 0}
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("fingerprint") != fingerprint:
+        raise SystemExit(f"{path} was written with a different model; pass --restart to start over.")
+    return checkpoint
+
+
+def _save_checkpoint(path, checkpoint):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def reclassify(input_path, output_path, text_column, model_directory, backend="pytorch", workers=None,
+               threads_per_worker=1, batch_size=64, checkpoint_every=10.0, restart=False, header=True):
+    """Labels every row of input_path into output_path; returns (rows processed in this run, seconds taken)."""
+    global _classifier
+    labels = read_emotion_labels(model_directory)
+    fingerprint = classifier_fingerprint(model_directory)
+    checkpoint_path = output_path + ".checkpoint"
+    checkpoint = _load_checkpoint(checkpoint_path, fingerprint, restart)
+    if checkpoint["output_bytes"] and not os.path.exists(output_path):
+        logger.warning("%s is gone, so its checkpoint can't be resumed; starting over", output_path)
+        checkpoint = {"rows_done": 0, "output_bytes": 0}
+    checkpoint["fingerprint"] = fingerprint
+    workers = workers or os.cpu_count() or 1
+
+    if backend != "onnx":
+        # Loaded before the pool forks, so every worker shares the weight pages copy-on-write.
+        _classifier = load_emotion_model(model_directory, backend)
+    context = multiprocessing.get_context("fork")
+    records = read_records(input_path, text_column, header)
+    output = _OutputWriter(output_path, labels, checkpoint["output_bytes"])
+    if header and not input_path.endswith(".jsonl"):
+        header, _ = next(records, (None, None))
+        if header is not None:
+            output.write_header(header)
+    rows = itertools.islice(records, checkpoint["rows_done"], None)
+
+    started = time.monotonic()
+    processed = 0
+    next_checkpoint = next_report = started + checkpoint_every
+    with context.Pool(workers) as pool:
+        # At most two batches per worker are read, queued or awaiting writing at any time.
+        in_flight = collections.deque()
+        batches = batched(rows, batch_size)
+        while True:
+            while len(in_flight) < 2 * workers:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                texts = [text for _, text in batch]
+                task = pool.apply_async(_classify_batch, (texts, model_directory, backend, threads_per_worker))
+                in_flight.append((batch, task))
+            if not in_flight:
+                break
+            batch, result = in_flight.popleft()
+            output.write([record for record, _ in batch], result.get())
+            processed += len(batch)
+            checkpoint["rows_done"] += len(batch)
+
+            now = time.monotonic()
+            if now >= next_checkpoint:
+                checkpoint["output_bytes"] = output.sync()
+                _save_checkpoint(checkpoint_path, checkpoint)
+                next_checkpoint = now + checkpoint_every
+            if now >= next_report:
+                logger.info("%d rows done (%.0f rows/s)", checkpoint["rows_done"], processed / (now - started))
+                next_report = now + checkpoint_every
+
+    checkpoint["output_bytes"] = output.sync()
+    output.close()
+    _save_checkpoint(checkpoint_path, checkpoint)
+    return processed, time.monotonic() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-label a CSV or JSONL file of texts with the EmoSic emotion model.")
+    parser.add_argument("input", help="CSV file (with a header row unless --no-header), or a .jsonl file.")
+    parser.add_argument("output", help="Labelled output; .jsonl for JSON lines, CSV otherwise, whatever the input format.")
+    parser.add_argument("--text-column", default="text",
+                        help="CSV column name or zero-based index, or JSONL field name, holding the text.")
+    parser.add_argument("--model-dir", default="./emosic_emotion_classifier_model")
+    parser.add_argument("--backend", choices=["pytorch", "onnx"], default="pytorch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--checkpoint-every", type=float, default=10.0, help="Seconds between checkpoints.")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over.")
+    parser.add_argument("--no-header", dest="header", action="store_false",
+                        help="The CSV has no header row; --text-column must then be a column index.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    processed, seconds = reclassify(
+        args.input, args.output, args.text_column, args.model_dir, args.backend, args.workers,
+        args.threads_per_worker, args.batch_size, args.checkpoint_every, args.restart, args.header
+    )
+    print(f"Labelled {processed} rows in {seconds:.1f}s ({processed / seconds if seconds else 0:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
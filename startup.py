@@ -0,0 +1,145 @@
+"""Model loading for the app: deferred heavy imports, background preload, warmup and a startup timeline."""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+from prediction_cache import model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Fixed seed so every process builds the same synthetic weights.
+SYNTHETIC_SEED = 0
+
+
+@contextmanager
+def _untimed(name):
+    yield
+
+
+def read_emotion_labels(model_directory):
+    """The model's labels in id order (anger, fear, joy, ...), read from config.json without loading the model."""
+    with open(os.path.join(model_directory, "config.json"), encoding="utf-8") as f:
+        id2label = json.load(f)["id2label"]
+    return [id2label[str(i)] for i in range(len(id2label))]
+
+
+def classifier_fingerprint(model_directory, synthetic=False):
+    """Prediction-cache fingerprint for the model in model_directory."""
+    fingerprint = model_fingerprint(model_directory)
+    if synthetic:
+        # Keep synthetic predictions out of the real model's entries in the shared cache.
+        fingerprint = f"synthetic-{SYNTHETIC_SEED}-{fingerprint}"
+    return fingerprint
+
+
+def load_emotion_model(model_directory, backend="pytorch", phase=_untimed, synthetic=False,
+                       intra_op_threads=None, server_socket=None, server_timeout=30.0):
+    """Loads the emotion classifier from model_directory.
+
+    Returns a classifier with the text-classification pipeline's call signature (a
+    LeanEmotionClassifier for the default "pytorch" backend); phase is a context-manager
+    factory used to time each loading step; server_timeout bounds each call to the inference server. With synthetic=True the weights are randomly initialized from config.json (same architecture
+    and labels), which lets benchmarks run without the LFS weights.
+    """
+    if backend == "onnx":
+        with phase("imports"):
+            from onnx_backend import OnnxEmotionClassifier
+        with phase("weights load"):
+            return OnnxEmotionClassifier(model_directory, intra_op_threads=intra_op_threads)
+    if backend == "server":
+        # The weights live in the inference server; only the tokenizer is loaded here.
+        with phase("imports"):
+            from inference_server import InferenceClient
+        with phase("tokenizer load"):
+            return InferenceClient(server_socket, model_directory, timeout=server_timeout)
+
+    with phase("imports"):
+        from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+        from lean_classifier import LeanEmotionClassifier
+    with phase("tokenizer load"):
+        tokenizer = AutoTokenizer.from_pretrained(model_directory, use_fast=True)
+    with phase("weights load"):
+        if synthetic:
+            import torch
+            torch.manual_seed(SYNTHETIC_SEED)
+            model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(model_directory))
+        else:
+            # safetensors weights are memory-mapped; low_cpu_mem_usage skips the throwaway random init.
+            model = AutoModelForSequenceClassification.from_pretrained(model_directory, low_cpu_mem_usage=True)
+        return LeanEmotionClassifier(model_directory, model=model, tokenizer=tokenizer)
+
+
+class ModelLoader:
+    """Loads and warms up the classifier on a background thread so the page can render immediately."""
+
+    def __init__(self, model_directory, backend="pytorch", warmup_texts=(), **load_options):
+        self.model_directory = model_directory
+        self.backend = backend
+        # Extra keyword arguments for load_emotion_model (synthetic, intra_op_threads, server_socket, server_timeout).
+        self.load_options = load_options
+        self.warmup_texts = list(warmup_texts)
+        self.classifier = None
+        self.fingerprint = None
+        self.error = None
+        self.timeline = []
+        # time.monotonic() when loading finished, successfully or not.
+        self.finished_at = None
+        self._done = threading.Event()
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="emosic-model-loader", daemon=True)
+        self._thread.start()
+
+    @contextmanager
+    def phase(self, name):
+        """Records how long the wrapped step took as (name, seconds) in the timeline."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.timeline.append((name, seconds))
+            REGISTRY.gauge("emosic_startup_phase_seconds", "Duration of each model startup phase.", phase=name).set(seconds)
+            logger.info("Startup phase %r took %.3fs", name, seconds)
+
+    def _run(self):
+        try:
+            classifier = load_emotion_model(self.model_directory, self.backend, phase=self.phase,
+                                            **self.load_options)
+            with self.phase("fingerprint"):
+                # A server client reports the fingerprint of the model the server actually runs.
+                self.fingerprint = getattr(classifier, "fingerprint", None) or classifier_fingerprint(
+                    self.model_directory, self.load_options.get("synthetic", False)
+                )
+            if self.warmup_texts:
+                # Single calls and one full batch, so both code paths have allocated and picked kernels.
+                with self.phase("warmup"):
+                    for text in self.warmup_texts:
+                        classifier(text, truncation=True)
+                    classifier(self.warmup_texts, batch_size=len(self.warmup_texts), truncation=True)
+            self.classifier = classifier
+        except Exception as e:
+            logger.exception("Loading the emotion model failed")
+            self.error = e
+        finally:
+            total = time.monotonic() - self._started
+            self.timeline.append(("total", total))
+            REGISTRY.gauge("emosic_startup_phase_seconds", phase="total").set(total)
+            self.finished_at = time.monotonic()
+            self._done.set()
+
+    def is_ready(self):
+        """True once the classifier is loaded and warmed up."""
+        return self._done.is_set() and self.error is None
+
+    def is_done(self):
+        """True once loading has finished, successfully or not."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Blocks until loading finishes; returns is_ready()."""
+        self._done.wait(timeout)
+        return self.is_ready()
@@ -0,0 +1,82 @@
+"""FeedbackWriter against the in-process fake gspread client: batching, quota backoff and spool replay."""
+import time
+
+from fake_sheets import FakeGspreadClient
+from feedback_writer import FeedbackWriter
+
+SHEET_NAME = "EmoSic_Feedback"
+
+
+class QuotaExceeded(Exception):
+    """Looks like the gspread.exceptions.APIError Sheets raises on HTTP 429."""
+
+    class response:
+        status_code = 429
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the feedback writer"
+        time.sleep(0.01)
+
+
+def make_writer(tmp_path, client, **options):
+    factory_calls = []
+
+    def client_factory():
+        factory_calls.append(1)
+        return client
+
+    options.setdefault("flush_interval", 0.05)
+    options.setdefault("initial_backoff", 0.05)
+    writer = FeedbackWriter(client_factory, SHEET_NAME, str(tmp_path / "spool.sqlite3"), **options)
+    return writer, factory_calls
+
+
+def test_rows_are_appended_in_batches(tmp_path):
+    client = FakeGspreadClient(SHEET_NAME)
+    writer, _ = make_writer(tmp_path, client, batch_size=3)
+    rows = [["2024-01-01 00:00:00", f"text {i}", "Joy", "English", "😍 Loved it!", ""] for i in range(7)]
+    for row in rows:
+        writer.submit(row)
+    wait_for(lambda: len(client.worksheet.rows) == len(rows))
+    writer.close()
+
+    assert client.worksheet.rows == rows
+    assert client.worksheet.calls >= 3
+    assert writer.counters["flushed"] == len(rows)
+    assert writer.pending() == 0
+
+
+def test_quota_error_backs_off_and_retries(tmp_path):
+    client = FakeGspreadClient(SHEET_NAME, failures=[QuotaExceeded("Quota exceeded")])
+    writer, factory_calls = make_writer(tmp_path, client)
+    writer.submit(["2024-01-01 00:00:00", "hello", "Joy", "English", "🙂 It was okay", ""])
+    wait_for(lambda: len(client.worksheet.rows) == 1)
+    writer.close()
+
+    assert client.worksheet.calls == 2
+    assert writer.counters["retries"] == 1
+    assert writer.last_error is None
+    # A quota error keeps the worksheet handle instead of reconnecting.
+    assert len(factory_calls) == 1
+
+
+def test_spooled_rows_are_replayed_by_a_new_writer(tmp_path):
+    def unreachable():
+        raise ConnectionError("Sheets is down")
+
+    row = ["2024-01-01 00:00:00", "left behind", "Sadness", "Hindi", "😕 Needs work", "more songs"]
+    first = FeedbackWriter(unreachable, SHEET_NAME, str(tmp_path / "spool.sqlite3"),
+                           flush_interval=0.05, initial_backoff=10.0)
+    first.submit(row)
+    wait_for(lambda: first.counters["retries"] >= 1)
+    first.close()
+    assert first.pending() == 1
+
+    client = FakeGspreadClient(SHEET_NAME)
+    second, _ = make_writer(tmp_path, client)
+    wait_for(lambda: client.worksheet.rows == [row])
+    second.close()
+    assert second.pending() == 0